@@ -1,48 +1,169 @@
-from typing import Optional, List
-from sqlalchemy.orm import Session
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
+import threading
+import time
+import orjson
+from sqlalchemy import delete, insert, text
+from sqlalchemy.orm import Session, load_only, selectinload
 
-from app.database import SessionLocal, Celebrity, init_db
+from app.database import engine, SessionLocal, Celebrity, CelebrityMovie, CelebrityMusic, init_db
 from app.models import CelebrityDetails, MovieCredit, MusicCredit
 
 
-def get_celebrity_info(celebrity_id: str) -> Optional[CelebrityDetails]:
-    """Fetch celebrity details from database."""
+# In-process cache of celebrity details: id -> (expiry time, details).
+# Other worker processes write to the same database without clearing this
+# cache, so entries expire after CELEBRITY_CACHE_TTL seconds and misses are
+# never cached (an id added elsewhere is found on the next request)
+CELEBRITY_CACHE_TTL = 300.0
+CELEBRITY_CACHE_SIZE = 1024
+_celebrity_cache: Dict[str, Tuple[float, CelebrityDetails]] = {}
+_celebrity_cache_lock = threading.Lock()
+# Bumped on every invalidation, so a read that raced a write isn't cached
+_celebrity_cache_generation = 0
+
+# Fetch credits in one extra IN query per table when loading a celebrity
+_CREDIT_LOAD_OPTIONS = [selectinload(Celebrity.movies), selectinload(Celebrity.music)]
+
+# Bulk-insert credits from a JSON array in a single statement
+_INSERT_MOVIES_SQL = text(
+    "INSERT INTO celebrity_movies (celeb_id, title, year, role) "
+    "SELECT :celeb_id, COALESCE(json_extract(value, '$.title'), ''), "
+    "COALESCE(json_extract(value, '$.year'), 0), "
+    "COALESCE(json_extract(value, '$.role'), '') "
+    "FROM json_each(:credits_json)"
+)
+_INSERT_MUSIC_SQL = text(
+    "INSERT INTO celebrity_music (celeb_id, title, year, type) "
+    "SELECT :celeb_id, COALESCE(json_extract(value, '$.title'), ''), "
+    "COALESCE(json_extract(value, '$.year'), 0), "
+    "COALESCE(json_extract(value, '$.type'), '') "
+    "FROM json_each(:credits_json)"
+)
+
+
+def _load_json(raw) -> list:
+    """Decode a raw LazyJSON column value, treating NULL as an empty list."""
+    return orjson.loads(raw) if raw else []
+
+
+def _insert_credits(session: Session, celebrity_id: str, statement, credits: Optional[List[dict]]):
+    """Insert movie or music credits for one celebrity via json_each."""
+    if credits:
+        session.execute(statement, {
+            "celeb_id": celebrity_id,
+            "credits_json": orjson.dumps(credits).decode()
+        })
+
+
+@contextmanager
+def _session_scope(session: Optional[Session]) -> Iterator[Session]:
+    """Use the caller's session if given, otherwise open (and close) a new one."""
+    if session is not None:
+        yield session
+    else:
+        with SessionLocal() as new_session:
+            yield new_session
+
+
+def get_celebrity_info(celebrity_id: str, session: Optional[Session] = None) -> Optional[CelebrityDetails]:
+    """
+    Fetch celebrity details, served from an in-process cache when warm.
+
+    A caller-supplied session bypasses the cache so the read sees that
+    session's transaction.
+    """
+    if session is None:
+        return _get_celebrity_info_cached(celebrity_id)
+    return _fetch_celebrity_info(session, celebrity_id)
+
+
+def invalidate_celebrity_cache() -> None:
+    """Drop cached celebrity details; called after every write."""
+    global _celebrity_cache_generation
+    with _celebrity_cache_lock:
+        _celebrity_cache.clear()
+        _celebrity_cache_generation += 1
+
+
+def _get_celebrity_info_cached(celebrity_id: str) -> Optional[CelebrityDetails]:
+    with _celebrity_cache_lock:
+        entry = _celebrity_cache.get(celebrity_id)
+        generation = _celebrity_cache_generation
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+
     with SessionLocal() as session:
-        celeb = session.query(Celebrity).filter(Celebrity.id == celebrity_id).first()
-        if celeb:
-            # Parse movies
-            movies = []
-            if celeb.movies:
-                for m in celeb.movies:
-                    movies.append(MovieCredit(
-                        title=m.get("title", ""),
-                        year=m.get("year", 0),
-                        role=m.get("role", "")
-                    ))
-
-            # Parse music
-            music = []
-            if celeb.music:
-                for m in celeb.music:
-                    music.append(MusicCredit(
-                        title=m.get("title", ""),
-                        year=m.get("year", 0),
-                        type=m.get("type", "")
-                    ))
-
-            return CelebrityDetails(
+        info = _fetch_celebrity_info(session, celebrity_id)
+
+    if info is not None:
+        with _celebrity_cache_lock:
+            if generation == _celebrity_cache_generation:
+                _celebrity_cache.pop(celebrity_id, None)
+                if len(_celebrity_cache) >= CELEBRITY_CACHE_SIZE:
+                    # Evict the oldest entry (dicts keep insertion order)
+                    del _celebrity_cache[next(iter(_celebrity_cache))]
+                _celebrity_cache[celebrity_id] = (time.monotonic() + CELEBRITY_CACHE_TTL, info)
+    return info
+
+
+def _fetch_celebrity_info(session: Session, celebrity_id: str) -> Optional[CelebrityDetails]:
+    """Fetch celebrity details from database."""
+    celeb = session.get(Celebrity, celebrity_id, options=_CREDIT_LOAD_OPTIONS)
+    if celeb:
+        # Rows come from our own DB, so skip Pydantic validation
+        movies = [
+            MovieCredit.model_construct(title=m.title, year=m.year, role=m.role)
+            for m in celeb.movies
+        ]
+        music = [
+            MusicCredit.model_construct(title=m.title, year=m.year, type=m.type)
+            for m in celeb.music
+        ]
+
+        return CelebrityDetails.model_construct(
+            id=celeb.id,
+            name=celeb.name,
+            date_of_birth=celeb.date_of_birth,
+            birthplace=celeb.birthplace,
+            profession=_load_json(celeb.profession),
+            biography=celeb.biography or "",
+            movies=movies,
+            music=music,
+            awards=_load_json(celeb.awards),
+            image_url=celeb.image_url
+        )
+    return None
+
+
+def get_celebrity_infos_bulk(
+    celebrity_ids: Iterable[str],
+    session: Optional[Session] = None
+) -> Dict[str, CelebrityDetails]:
+    """
+    Fetch brief details for several celebrities with a single IN query.
+
+    Only the columns needed for match summaries are loaded; movies, music
+    and biography are left empty.
+    """
+    ids = set(celebrity_ids)
+    if not ids:
+        return {}
+
+    infos = {}
+    with _session_scope(session) as session:
+        rows = (
+            session.query(Celebrity)
+            .options(load_only(Celebrity.id, Celebrity.name, Celebrity.profession))
+            .filter(Celebrity.id.in_(ids))
+            .all()
+        )
+        for celeb in rows:
+            infos[celeb.id] = CelebrityDetails.model_construct(
                 id=celeb.id,
                 name=celeb.name,
-                date_of_birth=celeb.date_of_birth,
-                birthplace=celeb.birthplace,
-                profession=celeb.profession or [],
-                biography=celeb.biography or "",
-                movies=movies,
-                music=music,
-                awards=celeb.awards or [],
-                image_url=celeb.image_url
+                profession=_load_json(celeb.profession)
             )
-    return None
+    return infos
 
 
 def add_celebrity(
@@ -55,10 +176,11 @@ def add_celebrity(
     movies: Optional[List[dict]] = None,
     music: Optional[List[dict]] = None,
     awards: Optional[List[str]] = None,
-    image_url: Optional[str] = None
+    image_url: Optional[str] = None,
+    session: Optional[Session] = None
 ) -> Celebrity:
     """Add a celebrity to the database."""
-    with SessionLocal() as session:
+    with _session_scope(session) as session:
         celeb = Celebrity(
             id=celebrity_id,
             name=name,
@@ -66,57 +188,127 @@ def add_celebrity(
             birthplace=birthplace,
             profession=profession,
             biography=biography,
-            movies=movies,
-            music=music,
             awards=awards,
             image_url=image_url
         )
         session.add(celeb)
+        session.flush()
+        _insert_credits(session, celebrity_id, _INSERT_MOVIES_SQL, movies)
+        _insert_credits(session, celebrity_id, _INSERT_MUSIC_SQL, music)
         session.commit()
-        session.refresh(celeb)
+        invalidate_celebrity_cache()
         return celeb
 
 
-def update_celebrity(celebrity_id: str, **kwargs) -> Optional[Celebrity]:
+# Rows per executemany batch for bulk ingest
+BULK_BATCH_SIZE = 5000
+
+
+def add_celebrities_bulk(celebrities: List[CelebrityDetails]) -> int:
+    """
+    Add many celebrities in a single transaction.
+
+    Uses executemany inserts in batches of BULK_BATCH_SIZE and
+    turns off SQLite's fsync for the duration of the ingest.
+    """
+    celeb_rows = []
+    movie_rows = []
+    music_rows = []
+    for celeb in celebrities:
+        celeb_rows.append({
+            "id": celeb.id,
+            "name": celeb.name,
+            "date_of_birth": celeb.date_of_birth,
+            "birthplace": celeb.birthplace,
+            "profession": celeb.profession,
+            "biography": celeb.biography,
+            "awards": celeb.awards,
+            "image_url": celeb.image_url
+        })
+        movie_rows.extend({"celeb_id": celeb.id, **m.model_dump()} for m in celeb.movies)
+        music_rows.extend({"celeb_id": celeb.id, **m.model_dump()} for m in celeb.music)
+
+    # Pin one connection so the pragma applies to the whole ingest
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        try:
+            for model, rows in (
+                (Celebrity, celeb_rows),
+                (CelebrityMovie, movie_rows),
+                (CelebrityMusic, music_rows)
+            ):
+                for start in range(0, len(rows), BULK_BATCH_SIZE):
+                    conn.execute(insert(model), rows[start:start + BULK_BATCH_SIZE])
+            conn.commit()
+        finally:
+            # The connection goes back to the pool, so restore the default
+            conn.rollback()
+            conn.exec_driver_sql("PRAGMA synchronous=NORMAL")
+            conn.commit()
+    invalidate_celebrity_cache()
+    return len(celeb_rows)
+
+
+def update_celebrity(celebrity_id: str, session: Optional[Session] = None, **kwargs) -> Optional[Celebrity]:
     """Update a celebrity in the database."""
-    with SessionLocal() as session:
-        celeb = session.query(Celebrity).filter(Celebrity.id == celebrity_id).first()
+    movies = kwargs.pop("movies", None)
+    music = kwargs.pop("music", None)
+    with _session_scope(session) as session:
+        celeb = session.get(Celebrity, celebrity_id)
         if celeb:
             for key, value in kwargs.items():
                 if hasattr(celeb, key):
                     setattr(celeb, key, value)
+            # Credit lists are replaced wholesale
+            if movies is not None:
+                session.execute(delete(CelebrityMovie).where(CelebrityMovie.celeb_id == celebrity_id))
+                _insert_credits(session, celebrity_id, _INSERT_MOVIES_SQL, movies)
+            if music is not None:
+                session.execute(delete(CelebrityMusic).where(CelebrityMusic.celeb_id == celebrity_id))
+                _insert_credits(session, celebrity_id, _INSERT_MUSIC_SQL, music)
             session.commit()
-            session.refresh(celeb)
+            invalidate_celebrity_cache()
             return celeb
     return None
 
 
-def delete_celebrity(celebrity_id: str) -> bool:
+def delete_celebrity(celebrity_id: str, session: Optional[Session] = None) -> bool:
     """Delete a celebrity from the database."""
-    with SessionLocal() as session:
-        celeb = session.query(Celebrity).filter(Celebrity.id == celebrity_id).first()
+    with _session_scope(session) as session:
+        celeb = session.get(Celebrity, celebrity_id)
         if celeb:
             session.delete(celeb)
             session.commit()
+            invalidate_celebrity_cache()
             return True
     return False
 
 
-def list_celebrities() -> List[CelebrityDetails]:
+def list_celebrities(session: Optional[Session] = None) -> List[CelebrityDetails]:
     """List all celebrities in the database."""
     celebrities = []
-    with SessionLocal() as session:
-        for celeb in session.query(Celebrity).all():
-            celebrities.append(CelebrityDetails(
+    with _session_scope(session) as session:
+        # Everything but the biography; credits live in their own tables
+        query = session.query(Celebrity).options(load_only(
+            Celebrity.id,
+            Celebrity.name,
+            Celebrity.image_url,
+            Celebrity.date_of_birth,
+            Celebrity.birthplace,
+            Celebrity.profession,
+            Celebrity.awards
+        ))
+        for celeb in query.all():
+            celebrities.append(CelebrityDetails.model_construct(
                 id=celeb.id,
                 name=celeb.name,
                 date_of_birth=celeb.date_of_birth,
                 birthplace=celeb.birthplace,
-                profession=celeb.profession or [],
-                biography=celeb.biography or "",
-                movies=[],  # Simplified for listing
+                profession=_load_json(celeb.profession),
+                biography="",  # Simplified for listing
+                movies=[],
                 music=[],
-                awards=celeb.awards or [],
+                awards=_load_json(celeb.awards),
                 image_url=celeb.image_url
             ))
     return celebrities
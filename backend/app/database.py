@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine, Column, String, Text, JSON
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Text, Integer, BLOB, ForeignKey, Index
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
+import orjson
 import os
 
 # Get the directory where this file is located
@@ -10,11 +13,74 @@ DB_PATH = os.path.join(BASE_DIR, "data", "celebrities.db")
 # Ensure data directory exists
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Shared across FastAPI worker threads, so SQLite's same-thread check is off
+engine = create_engine(
+    f"sqlite:///{DB_PATH}",
+    echo=False,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=5,
+    max_overflow=10
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune SQLite for a read-heavy API: WAL journal, relaxed sync, bigger caches."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    cursor.close()
+
+
+# Keep attributes loaded after commit so writes don't need a re-SELECT
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 
+class LazyJSON(TypeDecorator):
+    """
+    JSON stored as raw bytes.
+
+    Values are serialized with orjson on write, but rows are returned
+    undecoded so callers only pay for parsing the fields they use.
+    """
+
+    impl = BLOB
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return orjson.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        return value
+
+
+class CelebrityMovie(Base):
+    __tablename__ = "celebrity_movies"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    celeb_id = Column(String, ForeignKey("celebrities.id"), nullable=False, index=True)
+    title = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)
+
+
+class CelebrityMusic(Base):
+    __tablename__ = "celebrity_music"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    celeb_id = Column(String, ForeignKey("celebrities.id"), nullable=False, index=True)
+    title = Column(String, nullable=False)
+    year = Column(Integer, nullable=False)
+    type = Column(String, nullable=False)  # album, single, etc.
+
+
 class Celebrity(Base):
     __tablename__ = "celebrities"
 
@@ -22,17 +88,57 @@ class Celebrity(Base):
     name = Column(String, nullable=False)
     date_of_birth = Column(String, nullable=True)
     birthplace = Column(String, nullable=True)
-    profession = Column(JSON, nullable=True)  # List of professions
+    profession = Column(LazyJSON, nullable=True)  # List of professions
     biography = Column(Text, nullable=True)
-    movies = Column(JSON, nullable=True)  # List of {title, year, role}
-    music = Column(JSON, nullable=True)  # List of {title, year, type}
-    awards = Column(JSON, nullable=True)  # List of award strings
+    awards = Column(LazyJSON, nullable=True)  # List of award strings
     image_url = Column(String, nullable=True)
 
+    movies = relationship(CelebrityMovie, order_by=CelebrityMovie.id, cascade="all, delete-orphan")
+    music = relationship(CelebrityMusic, order_by=CelebrityMusic.id, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_celebrity_name", "name"),
+    )
+
 
 def init_db():
     """Initialize the database tables."""
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any new indexes explicitly
+    for index in Celebrity.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    _migrate_legacy_credits()
+
+
+def _migrate_legacy_credits():
+    """
+    Move movies/music out of the old JSON columns on `celebrities`.
+
+    Older databases stored credits as JSON arrays on each row; they are
+    copied into the normalized tables with json_each and the columns dropped.
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns("celebrities")}
+    with engine.begin() as conn:
+        if "movies" in columns:
+            conn.execute(text(
+                "INSERT INTO celebrity_movies (celeb_id, title, year, role) "
+                "SELECT c.id, COALESCE(json_extract(j.value, '$.title'), ''), "
+                "COALESCE(json_extract(j.value, '$.year'), 0), "
+                "COALESCE(json_extract(j.value, '$.role'), '') "
+                "FROM celebrities c, json_each(c.movies) j "
+                "WHERE c.movies IS NOT NULL ORDER BY c.id, j.key"
+            ))
+            conn.execute(text("ALTER TABLE celebrities DROP COLUMN movies"))
+        if "music" in columns:
+            conn.execute(text(
+                "INSERT INTO celebrity_music (celeb_id, title, year, type) "
+                "SELECT c.id, COALESCE(json_extract(j.value, '$.title'), ''), "
+                "COALESCE(json_extract(j.value, '$.year'), 0), "
+                "COALESCE(json_extract(j.value, '$.type'), '') "
+                "FROM celebrities c, json_each(c.music) j "
+                "WHERE c.music IS NOT NULL ORDER BY c.id, j.key"
+            ))
+            conn.execute(text("ALTER TABLE celebrities DROP COLUMN music"))
 
 
 def get_db():
@@ -1,17 +1,34 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+import os
+
+# Run BLAS/OpenMP single-threaded by default: requests are already spread
+# across threads, and per-call thread pools only contend with each other.
+# Must be set before numpy is first imported.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
+import asyncio
+import anyio
+import json
+import re
 import numpy as np
 import cv2
-import base64
+import pybase64
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
 from app.ml.pipeline import CelebrityPipeline
-from app.celebrity_db import get_celebrity_info, list_celebrities, add_celebrity
+from app.celebrity_db import (
+    get_celebrity_info, get_celebrity_infos_bulk, list_celebrities, add_celebrity, add_celebrities_bulk
+)
 from app.models import RecognitionResponse, CelebrityMatch, BoundingBox, CelebrityDetails
-from app.database import init_db
+from app.database import init_db, get_db
 
 
 # Global pipeline instance
@@ -48,7 +65,81 @@ class FastRecognitionResponse(BaseModel):
 
 class CutoutResponse(BaseModel):
     cutout_image: str  # Base64 PNG with transparency
-    presentation_image: str  # Base64 PNG of B99-style presentation
+    presentation_image: str  # Base64 JPEG of B99-style presentation
+
+
+# Fast zlib level for PNG; JPEG for images that need no transparency
+PNG_FAST_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 90]
+
+
+def _encode_image(image: np.ndarray, ext: str, params: list) -> bytes:
+    """Encode an image; CPU-bound, so call via asyncio.to_thread."""
+    _, buffer = cv2.imencode(ext, image, params)
+    return buffer.tobytes()
+
+
+def _encode_base64(image: np.ndarray, ext: str, params: list) -> str:
+    """Encode an image and base64 it; CPU-bound, so call via asyncio.to_thread."""
+    _, buffer = cv2.imencode(ext, image, params)
+    # SIMD base64 straight from the contiguous imencode buffer
+    return pybase64.b64encode(memoryview(buffer)).decode('ascii')
+
+
+def _build_celebrity_matches(matches: list, db: Session) -> List[CelebrityMatch]:
+    """Convert pipeline matches into API models, with one DB query for all briefs."""
+    infos = get_celebrity_infos_bulk([m["celebrity_id"] for m in matches], session=db)
+    # Brief summary: first two professions
+    briefs = {
+        celeb_id: ", ".join(info.profession[:2]) if info.profession else None
+        for celeb_id, info in infos.items()
+    }
+    return [
+        CelebrityMatch.model_construct(
+            id=m["celebrity_id"],
+            name=m["name"],
+            confidence=m["confidence"],
+            color=m["color"],
+            bounding_box=BoundingBox.model_construct(**m["bbox"]),
+            brief=briefs.get(m["celebrity_id"])
+        )
+        for m in matches
+    ]
+
+
+# Accepted /cutout color format: RRGGBB hex, optional leading '#'
+HEX_COLOR_RE = re.compile(r"^#?[0-9A-Fa-f]{6}$")
+
+# Worker threads for CPU-bound image work (decode/encode) and sync endpoints
+THREAD_POOL_SIZE = 64
+
+# Longest edge the ML pipeline works at; larger uploads are downscaled first
+MAX_PIPELINE_EDGE = 1280
+
+
+def _downscale_for_pipeline(img: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Shrink an image so its longest edge fits MAX_PIPELINE_EDGE; returns (image, scale)."""
+    h, w = img.shape[:2]
+    if max(h, w) <= MAX_PIPELINE_EDGE:
+        return img, 1.0
+    scale = MAX_PIPELINE_EDGE / max(h, w)
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+
+def _rescale_bboxes(results: dict, scale: float) -> None:
+    """Map pipeline bboxes from the downscaled frame back to upload coordinates."""
+    if scale == 1.0:
+        return
+    for item in results.get("faces", []) + results["matches"]:
+        bbox = item["bbox"]
+        item["bbox"] = {key: int(round(value / scale)) for key, value in bbox.items()}
+
+
+async def _read_upload(image: UploadFile) -> np.ndarray:
+    """Read an upload into a uint8 buffer without blocking the event loop."""
+    # The spooled temp file is read in a worker thread, and frombuffer
+    # wraps the bytes without copying them again
+    return np.frombuffer(await asyncio.to_thread(image.file.read), np.uint8)
 
 
 @asynccontextmanager
@@ -57,6 +148,10 @@ async def lifespan(app: FastAPI):
     global pipeline
     print("Initializing Celebrity Lookup API...")
 
+    # Size both the asyncio.to_thread pool and Starlette's anyio pool
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE))
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREAD_POOL_SIZE
+
     # Initialize database
     init_db()
 
@@ -74,7 +169,8 @@ app = FastAPI(
     title="Celebrity Lookup API",
     description="Identify celebrities in photos with colored outlines and detailed information",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS for iOS app
@@ -84,30 +180,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Celebrities"],
 )
 
 
+# Health-check body never changes, so it is encoded once at import
+HEALTH_RESPONSE = ORJSONResponse({
+    "status": "healthy",
+    "service": "Celebrity Lookup API",
+    "version": "2.0.0"
+})
+AVAILABLE_COLORS = len(CelebrityPipeline.COLORS)
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "service": "Celebrity Lookup API",
-        "version": "2.0.0"
-    }
+    return HEALTH_RESPONSE
 
 
 @app.get("/stats")
 async def get_stats():
     """Get API statistics."""
     return {
-        "celebrities_in_database": len(pipeline.celebrity_db) if pipeline else 0,
-        "available_colors": len(CelebrityPipeline.COLORS)
+        "celebrities_in_database": len(pipeline.celeb_ids) if pipeline else 0,
+        "available_colors": AVAILABLE_COLORS
     }
 
 
 @app.post("/recognize", response_model=RecognitionResponse)
-async def recognize_celebrities(image: UploadFile = File(...)):
+async def recognize_celebrities(image: UploadFile = File(...), db: Session = Depends(get_db)):
     """
     Process an image to detect and identify celebrities.
 
@@ -130,47 +232,85 @@ async def recognize_celebrities(image: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        # Read image
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        nparr = await _read_upload(image)
+        img = await asyncio.to_thread(cv2.imdecode, nparr, cv2.IMREAD_COLOR)
 
         if img is None:
             raise HTTPException(status_code=400, detail="Could not decode image")
 
-        # Run ML pipeline
-        results = pipeline.process(img)
+        img, scale = _downscale_for_pipeline(img)
 
-        # Build response
-        celebrities = []
-        for match in results["matches"]:
-            celeb_info = get_celebrity_info(match["celebrity_id"])
-            brief = None
-            if celeb_info:
-                # Create a brief summary
-                brief = f"{', '.join(celeb_info.profession[:2])}" if celeb_info.profession else None
-
-            celebrities.append(CelebrityMatch(
-                id=match["celebrity_id"],
-                name=match["name"],
-                confidence=match["confidence"],
-                color=match["color"],
-                bounding_box=BoundingBox(
-                    x=match["bbox"]["x"],
-                    y=match["bbox"]["y"],
-                    width=match["bbox"]["width"],
-                    height=match["bbox"]["height"]
-                ),
-                brief=brief
-            ))
-
-        # Encode annotated image as base64 PNG
-        _, buffer = cv2.imencode('.png', results["annotated_image"])
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-
-        return RecognitionResponse(
-            annotated_image=img_base64,
-            celebrities=celebrities
+        # Run ML pipeline off the event loop (the first confident match also
+        # loads the segmentation model)
+        # img isn't used again, so the pipeline can annotate it directly
+        results = await asyncio.to_thread(pipeline.process, img, inplace=True)
+        _rescale_bboxes(results, scale)
+
+        # Look up celebrity briefs while the annotated image is PNG/base64 encoded
+        celebrities, img_base64 = await asyncio.gather(
+            asyncio.to_thread(_build_celebrity_matches, results["matches"], db),
+            asyncio.to_thread(_encode_base64, results["annotated_image"], '.png', PNG_FAST_PARAMS)
+        )
+
+        # Return the payload directly to skip response_model re-serialization
+        # of the large base64 string
+        return ORJSONResponse(content={
+            "annotated_image": img_base64,
+            "celebrities": [c.model_dump() for c in celebrities]
+        })
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+
+@app.post(
+    "/recognize/binary",
+    response_class=Response,
+    responses={200: {"content": {"image/png": {}}}}
+)
+async def recognize_celebrities_binary(image: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Same as `/recognize`, but returns the annotated image as raw PNG bytes.
+
+    **Request:** Multipart form with image file
+
+    **Response:**
+    - Body: PNG with colored edges
+    - `X-Celebrities` header: JSON list of identified celebrities
+    """
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="ML pipeline not initialized")
+
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    try:
+        nparr = await _read_upload(image)
+        img = await asyncio.to_thread(cv2.imdecode, nparr, cv2.IMREAD_COLOR)
+
+        if img is None:
+            raise HTTPException(status_code=400, detail="Could not decode image")
+
+        img, scale = _downscale_for_pipeline(img)
+
+        # img isn't used again, so the pipeline can annotate it directly
+        results = await asyncio.to_thread(pipeline.process, img, inplace=True)
+        _rescale_bboxes(results, scale)
+
+        # Look up celebrity briefs while the annotated image is PNG encoded
+        celebrities, png_bytes = await asyncio.gather(
+            asyncio.to_thread(_build_celebrity_matches, results["matches"], db),
+            asyncio.to_thread(_encode_image, results["annotated_image"], '.png', PNG_FAST_PARAMS)
+        )
+
+        # Headers must be latin-1, so keep the JSON ASCII-escaped
+        celebrities_json = json.dumps(
+            [c.model_dump() for c in celebrities], separators=(",", ":")
+        )
+        return Response(
+            content=png_bytes,
+            media_type="image/png",
+            headers={"X-Celebrities": celebrities_json}
         )
 
     except Exception as e:
@@ -195,42 +335,35 @@ async def recognize_celebrities_fast(image: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        nparr = await _read_upload(image)
+        img = await asyncio.to_thread(cv2.imdecode, nparr, cv2.IMREAD_COLOR)
 
         if img is None:
             raise HTTPException(status_code=400, detail="Could not decode image")
 
-        # Run fast pipeline (no segmentation)
-        results = pipeline.process_fast(img)
+        img, scale = _downscale_for_pipeline(img)
+
+        # Run fast pipeline (no segmentation); detection and encoding still
+        # take hundreds of milliseconds, so keep them off the event loop
+        results = await asyncio.to_thread(pipeline.process_fast, img)
+        _rescale_bboxes(results, scale)
 
         # Build response
         faces = [
-            FastRecognitionFace(
-                bounding_box=BoundingBox(
-                    x=f["bbox"]["x"],
-                    y=f["bbox"]["y"],
-                    width=f["bbox"]["width"],
-                    height=f["bbox"]["height"]
-                )
+            FastRecognitionFace.model_construct(
+                bounding_box=BoundingBox.model_construct(**f["bbox"])
             )
             for f in results["faces"]
         ]
 
         matches = [
-            FastRecognitionMatch(
+            FastRecognitionMatch.model_construct(
                 celebrity_id=m["celebrity_id"],
                 name=m["name"],
                 confidence=m["confidence"],
                 color=m["color"],
                 face_index=m["face_index"],
-                bounding_box=BoundingBox(
-                    x=m["bbox"]["x"],
-                    y=m["bbox"]["y"],
-                    width=m["bbox"]["width"],
-                    height=m["bbox"]["height"]
-                )
+                bounding_box=BoundingBox.model_construct(**m["bbox"])
             )
             for m in results["matches"]
         ]
@@ -249,7 +382,8 @@ async def generate_cutout(
     face_width: int = Form(...),
     face_height: int = Form(...),
     color: str = Form(...),
-    name: str = Form(...)
+    name: str = Form(...),
+    quality: str = Form("fast")
 ):
     """
     Generate Brooklyn Nine-Nine style cutout for a specific person.
@@ -263,6 +397,7 @@ async def generate_cutout(
     - face_x, face_y, face_width, face_height: Face bounding box
     - color: Hex color for the theme
     - name: Celebrity name to display
+    - quality (optional): "fast" (default) or "high" for alpha-matted edges (much slower)
     """
     if pipeline is None:
         raise HTTPException(status_code=503, detail="ML pipeline not initialized")
@@ -270,32 +405,38 @@ async def generate_cutout(
     if not image.content_type or not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
+    if not HEX_COLOR_RE.match(color):
+        raise HTTPException(status_code=400, detail="Color must be a hex string like #FF6B6B")
+    color_rgb = tuple(bytes.fromhex(color.lstrip('#')))
+
+    if quality not in ("fast", "high"):
+        raise HTTPException(status_code=400, detail="Quality must be 'fast' or 'high'")
+
     try:
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        nparr = await _read_upload(image)
+        img = await asyncio.to_thread(cv2.imdecode, nparr, cv2.IMREAD_COLOR)
 
         if img is None:
             raise HTTPException(status_code=400, detail="Could not decode image")
 
+        img, scale = _downscale_for_pipeline(img)
+
         # Generate cutout
+        # Face box arrives in upload coordinates; cutout is rendered in the downscaled frame
         face_box = {
-            "x": face_x,
-            "y": face_y,
-            "width": face_width,
-            "height": face_height
+            "x": int(face_x * scale),
+            "y": int(face_y * scale),
+            "width": int(face_width * scale),
+            "height": int(face_height * scale)
         }
 
-        result = pipeline.generate_cutout(img, face_box, color, name)
-
-        # Encode cutout as PNG with transparency
-        cutout_pil = cv2.cvtColor(result["cutout_rgba"], cv2.COLOR_RGBA2BGRA)
-        _, cutout_buffer = cv2.imencode('.png', cutout_pil)
-        cutout_base64 = base64.b64encode(cutout_buffer).decode('utf-8')
+        result = await pipeline.generate_cutout_async(img, face_box, color_rgb, name, quality)
 
-        # Encode presentation as PNG
-        _, presentation_buffer = cv2.imencode('.png', result["presentation_bgr"])
-        presentation_base64 = base64.b64encode(presentation_buffer).decode('utf-8')
+        # Encode cutout as PNG with transparency, presentation as JPEG
+        cutout_base64, presentation_base64 = await asyncio.gather(
+            asyncio.to_thread(_encode_base64, result["cutout_bgra"], '.png', PNG_FAST_PARAMS),
+            asyncio.to_thread(_encode_base64, result["presentation_bgr"], '.jpg', JPEG_PARAMS)
+        )
 
         return CutoutResponse(
             cutout_image=cutout_base64,
@@ -323,13 +464,13 @@ async def get_celebrity_details(celebrity_id: str):
 
 
 @app.get("/celebrities", response_model=list[CelebrityDetails])
-async def list_all_celebrities():
+async def list_all_celebrities(db: Session = Depends(get_db)):
     """List all celebrities in the database."""
-    return list_celebrities()
+    return list_celebrities(session=db)
 
 
 @app.post("/celebrity", response_model=CelebrityDetails)
-async def create_celebrity(celebrity: CelebrityDetails):
+async def create_celebrity(celebrity: CelebrityDetails, db: Session = Depends(get_db)):
     """Add a new celebrity to the database (admin endpoint)."""
     try:
         add_celebrity(
@@ -342,13 +483,25 @@ async def create_celebrity(celebrity: CelebrityDetails):
             movies=[m.model_dump() for m in celebrity.movies],
             music=[m.model_dump() for m in celebrity.music],
             awards=celebrity.awards,
-            image_url=celebrity.image_url
+            image_url=celebrity.image_url,
+            session=db
         )
         return celebrity
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post("/celebrities/bulk")
+async def create_celebrities_bulk(celebrities: List[CelebrityDetails]):
+    """Add many celebrities in one transaction (admin endpoint for dataset ingest)."""
+    try:
+        # A large ingest runs for seconds; keep it off the event loop
+        inserted = await asyncio.to_thread(add_celebrities_bulk, celebrities)
+        return {"inserted": inserted}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -2,10 +2,91 @@ import cv2
 import numpy as np
 from PIL import Image
 from rembg import remove, new_session
+from rembg.sessions import sessions_class
+import onnxruntime as ort
+from onnxruntime.quantization import quantize_dynamic, QuantType
+import dlib
 import face_recognition
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Iterator
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 import os
 import json
+import tempfile
+import threading
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; matching falls back to NumPy
+    njit = None
+
+try:
+    import faiss
+except ImportError:  # faiss is optional; matching falls back to a linear scan
+    faiss = None
+
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:  # threadpoolctl is optional; BLAS keeps its startup thread count
+    ThreadpoolController = None
+
+# Our OpenCV calls are short and already run from several request and
+# worker threads; OpenCV's own pool only adds contention on top of that
+cv2.setNumThreads(1)
+
+
+if njit is not None:
+    # float32 value of every float16 bit pattern. numba can't read float16
+    # arrays, so the kernel takes the raw uint16 codes and decodes through
+    # this table (256 KB, stays in L2)
+    _HALF_TO_FLOAT = np.arange(1 << 16, dtype=np.uint32).astype(np.uint16).view(np.float16).astype(np.float32)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _nearest_squared(codes, half_to_float, query):
+        """Row nearest to query and its squared distance, in one pass with no temporaries."""
+        # Each parallel chunk keeps its own best; the chunk winners are reduced at the end
+        n = codes.shape[0]
+        chunks = min(n, 64)
+        best_rows = np.empty(chunks, dtype=np.int64)
+        best_squared = np.empty(chunks, dtype=np.float64)
+        for c in prange(chunks):
+            best_row = -1
+            best = np.inf
+            for i in range(c * n // chunks, (c + 1) * n // chunks):
+                total = 0.0
+                for k in range(codes.shape[1]):
+                    diff = half_to_float[codes[i, k]] - query[k]
+                    total += diff * diff
+                if total < best:
+                    best = total
+                    best_row = i
+            best_rows[c] = best_row
+            best_squared[c] = best
+        winner = best_squared.argmin()
+        return best_rows[winner], best_squared[winner]
+
+
+@contextmanager
+def _atomic_output(final_path: str) -> Iterator[str]:
+    """
+    Yield a unique temp path next to final_path and rename it over final_path
+    once the block succeeds.
+
+    Worker processes starting together may write the same file; each gets its
+    own temp file, so none of them can truncate or rename another's partial
+    output, and readers only ever see a complete file.
+    """
+    directory, name = os.path.split(final_path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=os.path.splitext(name)[1])
+    os.close(fd)
+    try:
+        yield temp_path
+        os.replace(temp_path, final_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 
 class CelebrityPipeline:
@@ -48,50 +129,299 @@ class CelebrityPipeline:
         "#6C5CE7": [(20, 15, 35), (90, 75, 190)],      # Dark to purple
     }
 
-    def __init__(self, celebrity_encodings_path: Optional[str] = None):
+    # Face detection runs on a downscaled frame; locations are mapped back
+    # to full resolution before encoding
+    DETECTION_SCALE = 0.25
+    # Never shrink the detection frame's short side below this, so small
+    # faces stay above the HOG detector's minimum window
+    MIN_DETECTION_SIDE = 320
+    # Detection frames at least this large are scanned without upsampling;
+    # faces in them are already above the detector's minimum size
+    NO_UPSAMPLE_SIDE = 480
+    # Images smaller than this cannot hold a detectable face
+    MIN_IMAGE_SIDE = 20
+
+    # On-disk and memory-mapped encoding precision (half the bytes of float32)
+    ENCODING_DTYPE = np.float16
+    # Database size from which the fused numba nearest-row kernel beats the BLAS GEMV
+    NUMBA_MIN_ENCODINGS = 2000
+    # BLAS threads for the matching GEMV on large databases; the process
+    # otherwise runs BLAS single-threaded (see main.py)
+    BLAS_MATCH_THREADS = 4
+    # Rows per GEMV tile in the BLAS scan: each tile's 64 KB distance vector
+    # stays in L2 while it is offset and reduced, and 8 MB of float32 rows
+    # is still enough work to split across BLAS_MATCH_THREADS
+    MATCH_TILE_ROWS = 16384
+    # Database size from which an approximate HNSW index replaces the exact scan
+    FAISS_MIN_ENCODINGS = 20000
+    # HNSW graph degree and search breadth (higher = more accurate, slower)
+    HNSW_NEIGHBORS = 32
+    HNSW_EF_SEARCH = 64
+    # Candidates taken from the 8-bit HNSW index and re-ranked on exact distances
+    HNSW_RERANK = 8
+
+    # Threads segmenting faces in parallel; each holds its own U2-Net session
+    SEGMENTATION_WORKERS = min(4, os.cpu_count() or 1)
+
+    # ONNX Runtime providers for the rembg models, in preference order;
+    # unavailable ones are skipped
+    ORT_PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+
+    # Segmentation model input sizes and the ImageNet normalization both
+    # use (matches rembg's preprocessing)
+    U2NET_INPUT_SIZE = 320
+    BIREFNET_INPUT_SIZE = 1024
+    SEG_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    SEG_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    # Longest side of the crop handed to U2-Net; the alpha is upscaled back.
+    # BiRefNet crops are capped at BIREFNET_INPUT_SIZE instead, so shrinking
+    # never costs that model resolution
+    SEG_MAX_SIDE = 512
+
+    # Matches below this confidence get a box outline instead of segmentation
+    SEG_THRESHOLD = 0.55
+
+    def __init__(
+        self,
+        celebrity_encodings_path: Optional[str] = None,
+        seg_threshold: Optional[float] = None,
+        detection_scale: Optional[float] = None
+    ):
         """
         Initialize the ML pipeline.
 
         Args:
             celebrity_encodings_path: Path to directory containing celebrity face encodings
+            seg_threshold: Minimum match confidence for a segmented outline
+                (defaults to SEG_THRESHOLD)
+            detection_scale: Downscale factor for the face detection frame
+                (defaults to DETECTION_SCALE; 1.0 detects at full resolution)
         """
+        self.seg_threshold = self.SEG_THRESHOLD if seg_threshold is None else seg_threshold
+        self.detection_scale = self.DETECTION_SCALE if detection_scale is None else detection_scale
+
         print("Initializing face recognition...")
+        # dlib ResNet encoder, called directly so all faces go through in one batch
+        self._encoder = face_recognition.api.face_encoder
+
+        # A CUDA build of dlib runs the encoder on the GPU; use the more
+        # accurate CNN detector there too, since it no longer costs seconds
+        self.use_cuda = bool(getattr(dlib, "DLIB_USE_CUDA", False))
+        self._detection_model = "cnn" if self.use_cuda else "hog"
+        print(f"dlib CUDA: {'enabled' if self.use_cuda else 'disabled'} (detector: {self._detection_model})")
+
+        # Palette colors pre-parsed for the drawing helpers, in COLORS order
+        self._palette_bgr = [self._hex_to_bgr(color) for color in self.COLORS]
+
+        # Structuring element shared by the edge-drawing morphology
+        self._k3 = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+        # Edge morphology goes through OpenCV's T-API (UMat) when an OpenCL
+        # device works; otherwise it stays on plain arrays on the CPU
+        self.use_opencl = self._init_opencl()
+        print(f"OpenCL: {'enabled' if self.use_opencl else 'disabled'}")
 
-        # Initialize segmentation sessions
-        print("Loading segmentation model...")
-        # Use birefnet-portrait for high-quality cutouts (best for portrait segmentation)
-        self.seg_session_hq = new_session("birefnet-portrait")
-        # Keep a faster model for real-time preview
-        self.seg_session_fast = new_session("u2net_human_seg")
-        self.seg_session = self.seg_session_fast  # Default to fast for backward compatibility
-        print("Segmentation models loaded.")
+        # B99 backgrounds keyed by RGB tuple, for callers that pass parsed colors
+        self._b99_backgrounds_rgb = {
+            self._hex_to_rgb(color): gradient for color, gradient in self.B99_BACKGROUNDS.items()
+        }
+
+        # Segmentation sessions are created on first use (see seg_session_hq,
+        # seg_session_fast and _get_u2net), so startup and requests without a
+        # confident match never load them. Reentrant because a loader may
+        # reach another lazy session
+        self._seg_lock = threading.RLock()
+        self._seg_session_hq = None
+        self._seg_session_fast = None
+        self._u2net = None
+        # Fast model run directly through onnxruntime: FP32 on CUDA when
+        # onnxruntime-gpu is installed, otherwise an INT8-quantized copy on CPU
+        # (quantized kernels only pay off on the CPU)
+        self.seg_use_cuda = "CUDAExecutionProvider" in ort.get_available_providers()
+        if self.seg_use_cuda:
+            self._u2net_providers = self.ORT_PROVIDERS
+        else:
+            self._u2net_providers = ["CPUExecutionProvider"]
+
+        # Per-face pool for segmentation (when U2-Net can't batch) and edge
+        # preparation; workers open their own session on first use so ONNX
+        # inference (which releases the GIL) runs truly concurrently
+        self._seg_local = threading.local()
+        self._seg_executor = ThreadPoolExecutor(
+            max_workers=self.SEGMENTATION_WORKERS,
+            thread_name_prefix="segment",
+            initializer=self._init_segment_worker
+        )
+
+        # Cutout stages, one thread each: segmentation of the next request
+        # overlaps compositing of the previous one
+        self._cutout_seg_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cutout-seg")
+        self._cutout_compose_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cutout-compose")
 
         # Load celebrity face encodings
         if celebrity_encodings_path is None:
             base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
             celebrity_encodings_path = os.path.join(base_dir, "data", "celebrity_encodings")
 
-        self.celebrity_db = self._load_celebrity_encodings(celebrity_encodings_path)
-        print(f"Loaded {len(self.celebrity_db)} celebrity encodings.")
+        # Parallel arrays: row i of celeb_matrix is celeb_ids[i] / celeb_names[i]
+        self.celeb_ids, self.celeb_names, self.celeb_matrix = self._load_celebrity_encodings(
+            celebrity_encodings_path
+        )
+        self.faiss_index = self._load_faiss_index(celebrity_encodings_path)
+        # faiss and the numba kernel read the float16 rows directly; only the
+        # BLAS scan (small databases, or numba missing) keeps a float32 copy,
+        # with squared row norms so matching is one matrix-vector product
+        self._celeb_matrix_f32 = None
+        self.celeb_sq_norms = None
+        if self.faiss_index is None and not self._use_numba():
+            self._celeb_matrix_f32 = self.celeb_matrix.astype(np.float32)
+            self.celeb_sq_norms = np.einsum('ij,ij->i', self._celeb_matrix_f32, self._celeb_matrix_f32)
+        if self._use_numba():
+            # Compile (or load from numba's cache) now rather than on the first request
+            _nearest_squared(
+                self.celeb_matrix[:1].view(np.uint16),
+                _HALF_TO_FLOAT,
+                np.zeros(self.celeb_matrix.shape[1], dtype=np.float32)
+            )
+        self._blas_controller = ThreadpoolController() if ThreadpoolController is not None else None
+        # Held while BLAS is widened for a match (see _nearest_blas)
+        self._blas_lock = threading.Lock()
+        print(f"Loaded {len(self.celeb_ids)} celebrity encodings.")
+
+    def _load_celebrity_encodings(self, path: str) -> Tuple[List[str], List[str], np.ndarray]:
+        """
+        Load pre-computed celebrity face encodings.
 
-    def _load_celebrity_encodings(self, path: str) -> Dict:
-        """Load pre-computed celebrity face encodings."""
-        db = {}
+        All encodings live in one (N, 128) float16 encodings.npy, memory-mapped
+        on load, with its row order in the generated encodings_index.json;
+        index.json is only read. The sidecar also records the mtime and size
+        of every per-celebrity .npy it was built from, so the blob is rebuilt
+        from those files whenever one is added, removed or re-encoded, or
+        index.json gains or loses an entry.
+
+        Returns:
+            Tuple of (celebrity ids, names, (N, 128) encoding matrix), row-aligned
+        """
         index_path = os.path.join(path, "index.json")
+        encodings_path = os.path.join(path, "encodings.npy")
+        rows_path = os.path.join(path, "encodings_index.json")
 
+        index = {}
         if os.path.exists(index_path):
             with open(index_path, 'r') as f:
                 index = json.load(f)
 
-            for celeb_id, info in index.items():
-                encoding_file = os.path.join(path, f"{celeb_id}.npy")
-                if os.path.exists(encoding_file):
-                    db[celeb_id] = {
-                        "name": info["name"],
-                        "encoding": np.load(encoding_file)
-                    }
-
-        return db
+        sources = self._encoding_sources(path, index)
+        if index and os.path.exists(encodings_path) and os.path.exists(rows_path):
+            with open(rows_path, 'r') as f:
+                rows = json.load(f)
+            ids = rows["ids"]
+            matrix = np.load(encodings_path, mmap_mode="r")
+            if rows["sources"] == sources and len(ids) == matrix.shape[0]:
+                return ids, [index[celeb_id]["name"] for celeb_id in ids], matrix
+
+        # No up-to-date blob: load one .npy per celebrity
+        ids, names, encodings = [], [], []
+        for celeb_id, info in index.items():
+            if sources[celeb_id] is not None:
+                ids.append(celeb_id)
+                names.append(info["name"])
+                encodings.append(np.load(os.path.join(path, f"{celeb_id}.npy")))
+
+        if not ids:
+            return ids, names, np.empty((0, 128), dtype=self.ENCODING_DTYPE)
+
+        # Stack encodings into one (N, 128) matrix so matching is a single NumPy pass
+        matrix = np.stack(encodings).astype(self.ENCODING_DTYPE)
+        self._save_encodings_blob(path, sources, ids, matrix)
+        return ids, names, matrix
+
+    def _encoding_sources(self, path: str, index: Dict) -> Dict[str, Optional[List[int]]]:
+        """[mtime_ns, size] of each index.json entry's .npy, or None when it has none."""
+        sources = {}
+        for celeb_id in index:
+            try:
+                stat = os.stat(os.path.join(path, f"{celeb_id}.npy"))
+            except FileNotFoundError:
+                sources[celeb_id] = None
+            else:
+                sources[celeb_id] = [stat.st_mtime_ns, stat.st_size]
+        return sources
+
+    def _save_encodings_blob(self, path: str, sources: Dict, ids: List[str], matrix: np.ndarray):
+        """Write encodings.npy, with its row order and source files in encodings_index.json."""
+        encodings_path = os.path.join(path, "encodings.npy")
+        rows_path = os.path.join(path, "encodings_index.json")
+
+        try:
+            # The blob goes first: a sidecar that doesn't match it only costs a rebuild
+            with _atomic_output(encodings_path) as temp_path:
+                np.save(temp_path, matrix)
+            with _atomic_output(rows_path) as temp_path:
+                with open(temp_path, 'w') as f:
+                    json.dump({"ids": ids, "sources": sources}, f)
+        except OSError as e:
+            # A read-only data directory just means loading file by file each start
+            print(f"Could not write encodings.npy: {e}")
+
+    def _load_faiss_index(self, path: str):
+        """
+        Load or build an HNSW index over the encodings for large databases.
+
+        Vectors are stored as 8-bit scalar-quantized codes, a quarter of the
+        float32 size; _match_face re-ranks the hits on exact distances. The
+        index is saved as encodings.hnsw and reused while it is newer than
+        encodings_index.json and covers every encoding. The saved file is
+        memory-mapped read-only, so worker processes (uvicorn --workers N)
+        share its pages through the OS page cache instead of each holding a
+        copy. Returns None when faiss is not installed or the database is
+        small enough for an exact scan.
+        """
+        if faiss is None or len(self.celeb_ids) < self.FAISS_MIN_ENCODINGS:
+            return None
+
+        index_path = os.path.join(path, "encodings.hnsw")
+        source_path = os.path.join(path, "encodings_index.json")
+        if (
+            os.path.exists(index_path)
+            and os.path.exists(source_path)
+            and os.path.getmtime(index_path) >= os.path.getmtime(source_path)
+        ):
+            index = self._read_faiss_index(index_path)
+            if index.ntotal == len(self.celeb_ids):
+                index.hnsw.efSearch = self.HNSW_EF_SEARCH
+                return index
+
+        print("Building HNSW index over celebrity encodings...")
+        # L2 metric on the raw encodings keeps distances comparable to tolerance
+        matrix = np.ascontiguousarray(self.celeb_matrix, dtype=np.float32)
+        index = faiss.IndexHNSWSQ(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, self.HNSW_NEIGHBORS)
+        index.train(matrix)
+        index.add(matrix)
+        index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        try:
+            # Workers starting together all build; each writes its own temp file
+            # and renames it, so nobody maps a file another worker is still
+            # writing, and rewriting in place would corrupt existing mappings
+            with _atomic_output(index_path) as temp_path:
+                faiss.write_index(index, temp_path)
+        except (RuntimeError, OSError) as e:
+            # faiss reports I/O failures as RuntimeError; just rebuild next start
+            print(f"Could not write HNSW index: {e}")
+            return index
+        # Swap the freshly built copy for the shared mapping of the saved file
+        mapped = self._read_faiss_index(index_path)
+        mapped.hnsw.efSearch = self.HNSW_EF_SEARCH
+        return mapped
+
+    @staticmethod
+    def _read_faiss_index(index_path: str):
+        """Memory-map a saved faiss index read-only."""
+        # IO_FLAG_MMAP alone only maps IVF lists; newer faiss releases also map
+        # flat codes and the HNSW graph in place
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        return faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
 
     def _match_face(
         self,
@@ -108,26 +438,146 @@ class CelebrityPipeline:
         Returns:
             Tuple of (celebrity_id, name, confidence) or None if no match
         """
-        best_match = None
-        best_distance = tolerance
+        if not self.celeb_ids:
+            return None
+
+        # Squared Euclidean distance to every celebrity at once (lower = more
+        # similar); only the winner needs the square root
+        query = face_encoding.astype(np.float32)
+        if self.faiss_index is not None:
+            # Approximate nearest neighbors on the quantized codes, then the
+            # exact squared distance for those few candidates
+            _, indices = self.faiss_index.search(query[np.newaxis], self.HNSW_RERANK)
+            candidates = indices[0][indices[0] >= 0]
+            if not len(candidates):
+                return None
+            diffs = self.celeb_matrix[candidates] - query
+            squared = np.einsum('ij,ij->i', diffs, diffs)
+            best = int(candidates[squared.argmin()])
+            best_squared = float(squared.min())
+        else:
+            if self._use_numba():
+                best, best_squared = _nearest_squared(self.celeb_matrix.view(np.uint16), _HALF_TO_FLOAT, query)
+                best, best_squared = int(best), float(best_squared)
+            else:
+                best, best_squared = self._nearest_blas(query)
+        best_distance = float(np.sqrt(max(0.0, best_squared)))
+
+        if best_distance < tolerance:
+            # Convert distance to confidence (0-1, higher = better)
+            return (self.celeb_ids[best], self.celeb_names[best], 1.0 - best_distance)
+        return None
 
-        for celeb_id, data in self.celebrity_db.items():
-            # Calculate face distance (lower = more similar)
-            distance = face_recognition.face_distance([data["encoding"]], face_encoding)[0]
+    def _use_numba(self) -> bool:
+        """Whether the exact scan should use the numba kernel (installed and worth it)."""
+        return njit is not None and len(self.celeb_ids) >= self.NUMBA_MIN_ENCODINGS
 
-            if distance < best_distance:
-                best_distance = distance
-                # Convert distance to confidence (0-1, higher = better)
-                confidence = 1.0 - distance
-                best_match = (celeb_id, data["name"], float(confidence))
+    def _nearest_blas(self, query: np.ndarray) -> Tuple[int, float]:
+        """
+        Exact nearest celebrity by BLAS GEMV, one tile of rows at a time.
 
-        return best_match
+        |m - q|^2 = |m|^2 - 2 m.q + |q|^2 is exact for the unnormalized dlib
+        encodings the 0.6 tolerance is tuned for. Per tile, the distances are
+        offset and reduced while still in cache, and only the running best
+        survives; BLAS is multi-threaded for large databases.
+
+        Returns:
+            Row index and squared distance of the nearest encoding
+        """
+        if self._blas_controller is None or len(self.celeb_ids) < self.NUMBA_MIN_ENCODINGS:
+            return self._scan_blas_tiles(query)
+        # The thread limit is process-wide and restores whatever it saw on
+        # entry; overlapping matches would restore each other's widened count
+        # and leave BLAS at BLAS_MATCH_THREADS for good, so widen one at a time
+        with self._blas_lock:
+            with self._blas_controller.limit(limits=self.BLAS_MATCH_THREADS, user_api="blas"):
+                return self._scan_blas_tiles(query)
+
+    def _scan_blas_tiles(self, query: np.ndarray) -> Tuple[int, float]:
+        """Tile loop of _nearest_blas, under whatever BLAS thread count is set."""
+        best, best_squared = -1, np.inf
+        for start in range(0, len(self.celeb_ids), self.MATCH_TILE_ROWS):
+            stop = start + self.MATCH_TILE_ROWS
+            squared = self._celeb_matrix_f32[start:stop] @ query
+            squared *= -2.0
+            squared += self.celeb_sq_norms[start:stop]
+            row = int(squared.argmin())
+            # Strict comparison keeps the first minimum, like a global argmin
+            if squared[row] < best_squared:
+                best, best_squared = start + row, float(squared[row])
+        return best, best_squared + float(query @ query)
+
+    def _detect_faces(self, rgb_image: np.ndarray, model: str = "hog") -> List[Tuple[int, int, int, int]]:
+        """
+        Detect faces on a downscaled copy of the image.
+
+        Args:
+            rgb_image: Full-resolution RGB image
+            model: face_recognition detector model ("hog" or "cnn")
+
+        Returns:
+            Face locations (top, right, bottom, left) in full-resolution coordinates
+        """
+        height, width = rgb_image.shape[:2]
+        if min(height, width) < self.MIN_IMAGE_SIDE:
+            return []
+
+        scale = max(self.detection_scale, self.MIN_DETECTION_SIDE / min(height, width))
+        if scale >= 1.0:
+            return face_recognition.face_locations(
+                rgb_image, self._upsample_times(rgb_image), model=model
+            )
+
+        small = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        inv = 1.0 / scale
+        return [
+            (
+                max(0, int(top * inv)),
+                min(width, int(right * inv)),
+                min(height, int(bottom * inv)),
+                max(0, int(left * inv))
+            )
+            for top, right, bottom, left in face_recognition.face_locations(
+                small, self._upsample_times(small), model=model
+            )
+        ]
+
+    def _upsample_times(self, frame: np.ndarray) -> int:
+        """Detector upsampling for a frame: none for large frames, else once (the default)."""
+        return 0 if min(frame.shape[:2]) >= self.NO_UPSAMPLE_SIDE else 1
+
+    def _encode_faces(
+        self,
+        rgb_image: np.ndarray,
+        face_locations: List[Tuple[int, int, int, int]]
+    ) -> List[np.ndarray]:
+        """
+        Compute face encodings for all faces in one batched dlib call.
+
+        Equivalent to face_recognition.face_encodings (small landmark model,
+        no jitter), but the ResNet sees every face in a single forward pass.
+
+        Args:
+            rgb_image: Input image (RGB)
+            face_locations: Face locations (top, right, bottom, left)
+
+        Returns:
+            List of 128-dimensional face embeddings, one per location
+        """
+        if not face_locations:
+            return []
+
+        shapes = dlib.full_object_detections()
+        shapes.extend(face_recognition.api._raw_face_landmarks(rgb_image, face_locations, model="small"))
+        descriptors = self._encoder.compute_face_descriptor(rgb_image, shapes, 0)
+        return [np.array(descriptor) for descriptor in descriptors]
 
     def _segment_person_high_quality(
         self,
         image: np.ndarray,
         face_location: Tuple[int, int, int, int],
-        use_hq_model: bool = True
+        use_hq_model: bool = True,
+        quality: str = "fast"
     ) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
         """
         High-quality person segmentation with refined edges using BiRefNet.
@@ -136,6 +586,8 @@ class CelebrityPipeline:
             image: Input image (RGB)
             face_location: Face location (top, right, bottom, left) from face_recognition
             use_hq_model: Whether to use the high-quality BiRefNet model
+            quality: "high" runs rembg's alpha matting; "fast" skips it and
+                smooths the mask edges with a guided filter instead
 
         Returns:
             Tuple of (alpha mask 0-255, crop_box)
@@ -156,28 +608,45 @@ class CelebrityPipeline:
 
         crop_box = (body_x1, body_y1, body_x2, body_y2)
 
-        # Crop region
+        # Crop region, shrunk so rembg and alpha matting work on fewer pixels,
+        # but never below the model's own input size
         crop = image[body_y1:body_y2, body_x1:body_x2]
-        pil_crop = Image.fromarray(crop)
-
-        # Select model based on quality requirement
-        session = self.seg_session_hq if use_hq_model else self.seg_session_fast
-
-        # Get alpha mask using rembg with BiRefNet (returns RGBA)
-        # BiRefNet produces much cleaner edges than U2-Net
-        result = remove(pil_crop, session=session, alpha_matting=True,
-                       alpha_matting_foreground_threshold=240,
-                       alpha_matting_background_threshold=10,
-                       alpha_matting_erode_size=5)
-
-        # Extract alpha channel
-        result_np = np.array(result)
-        if result_np.shape[2] == 4:
-            alpha = result_np[:, :, 3]
+        crop_h, crop_w = crop.shape[:2]
+        max_side = self.BIREFNET_INPUT_SIZE if use_hq_model else self.SEG_MAX_SIDE
+        scale = max_side / max(crop_h, crop_w)
+        if scale < 1.0:
+            small = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
         else:
-            # Fallback to mask mode
-            mask_result = remove(pil_crop, session=session, only_mask=True)
-            alpha = np.array(mask_result)
+            small = crop
+        if quality == "high":
+            pil_crop = Image.fromarray(small)
+            session = self.seg_session_hq if use_hq_model else self.seg_session_fast
+
+            # Get alpha mask using rembg with BiRefNet (returns RGBA)
+            # BiRefNet produces much cleaner edges than U2-Net
+            result = remove(pil_crop, session=session, alpha_matting=True,
+                           alpha_matting_foreground_threshold=240,
+                           alpha_matting_background_threshold=10,
+                           alpha_matting_erode_size=5)
+
+            # Extract alpha channel
+            result_np = np.array(result)
+            if result_np.shape[2] == 4:
+                alpha = result_np[:, :, 3]
+            else:
+                # Fallback to mask mode
+                mask_result = remove(pil_crop, session=session, only_mask=True)
+                alpha = np.array(mask_result)
+        else:
+            # Alpha matting costs far more than the model itself; the raw
+            # mask plus a guided filter is close enough for on-screen use.
+            # The model runs directly on the array, without rembg's PIL round trip
+            alpha = self._run_birefnet(small) if use_hq_model else self._run_u2net(small)
+            alpha = self._guided_alpha(small, alpha)
+
+        if small is not crop:
+            alpha = cv2.resize(alpha, (crop_w, crop_h), interpolation=cv2.INTER_LINEAR)
+            alpha = self._refine_alpha_edges(crop, alpha)
 
         # Post-process: ensure we're focusing on the person near the face
         # If multiple people are in the crop, isolate the one closest to center
@@ -185,6 +654,29 @@ class CelebrityPipeline:
 
         return alpha, crop_box
 
+    def _guided_alpha(self, image: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+        """
+        Soften a raw segmentation mask along the image's edges.
+
+        Uses OpenCV's guided filter when the contrib modules are installed;
+        otherwise returns alpha as is.
+        """
+        if not hasattr(cv2, "ximgproc"):
+            return alpha
+        # eps is in squared 8-bit units (1e-3 on a 0-1 scale)
+        return cv2.ximgproc.guidedFilter(image, alpha, 4, 1e-3 * 255 ** 2)
+
+    def _refine_alpha_edges(self, image: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+        """
+        Snap an upscaled alpha mask back onto the image's edges.
+
+        Uses a joint bilateral filter guided by the full-resolution crop when
+        OpenCV's contrib modules are installed; otherwise returns alpha as is.
+        """
+        if not hasattr(cv2, "ximgproc"):
+            return alpha
+        return cv2.ximgproc.jointBilateralFilter(image, alpha, 9, 25, 9)
+
     def _isolate_target_person(
         self,
         alpha: np.ndarray,
@@ -252,6 +744,251 @@ class CelebrityPipeline:
         # Apply the isolated mask to the original alpha
         return cv2.bitwise_and(alpha, isolated_mask)
 
+    def _quantize_u2net(self, model_path: str) -> str:
+        """
+        Quantize the U2-Net weights to INT8 once, next to the original model.
+
+        Args:
+            model_path: Path to the FP32 ONNX model downloaded by rembg
+
+        Returns:
+            Path to the quantized model
+        """
+        int8_path = os.path.splitext(model_path)[0] + "_int8.onnx"
+        if not os.path.exists(int8_path):
+            print("Quantizing segmentation model to INT8...")
+            # The model only appears under its final name once complete, so a
+            # crash or another worker never leaves a truncated model behind
+            with _atomic_output(int8_path) as temp_path:
+                quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _ort_session_options(self, intra_op_threads: int) -> ort.SessionOptions:
+        """ONNX Runtime options: full graph optimization and a fixed intra-op pool."""
+        sess_opts = ort.SessionOptions()
+        sess_opts.intra_op_num_threads = intra_op_threads
+        sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        sess_opts.enable_cpu_mem_arena = True
+        return sess_opts
+
+    @property
+    def seg_session_hq(self):
+        """birefnet-portrait rembg session for high-quality cutouts, loaded on first use."""
+        if self._seg_session_hq is None:
+            with self._seg_lock:
+                if self._seg_session_hq is None:
+                    print("Loading BiRefNet segmentation model...")
+                    session = self._new_rembg_session("birefnet-portrait")
+                    print(f"BiRefNet providers: {session.inner_session.get_providers()}")
+                    self._seg_session_hq = session
+        return self._seg_session_hq
+
+    @property
+    def seg_session_fast(self):
+        """u2net_human_seg rembg session for the fast "high" path, loaded on first use."""
+        if self._seg_session_fast is None:
+            with self._seg_lock:
+                if self._seg_session_fast is None:
+                    self._seg_session_fast = self._new_rembg_session("u2net_human_seg")
+        return self._seg_session_fast
+
+    @property
+    def seg_session(self):
+        """Default rembg session, the fast one (kept for backward compatibility)."""
+        return self.seg_session_fast
+
+    def _get_u2net(self) -> ort.InferenceSession:
+        """
+        Return the shared direct U2-Net session, loading it on first use.
+
+        The first call downloads the model if needed (and quantizes it on
+        CPU); concurrent first calls wait on _seg_lock instead of loading twice.
+        """
+        if self._u2net is None:
+            with self._seg_lock:
+                if self._u2net is None:
+                    print("Loading U2-Net segmentation model...")
+                    u2net_path = self._rembg_model_path("u2net_human_seg")
+                    self._u2net_path = u2net_path if self.seg_use_cuda else self._quantize_u2net(u2net_path)
+                    session = self._new_u2net_session()
+                    # rembg's exports leave the batch axis symbolic; a fixed 1 means one face per run
+                    self._u2net_batched = session.get_inputs()[0].shape[0] != 1
+                    print(f"U2-Net providers: {session.get_providers()}")
+                    self._u2net = session
+        return self._u2net
+
+    def _rembg_model_path(self, model_name: str) -> str:
+        """Download (once) a rembg model and return its path, without opening a rembg session."""
+        for session_class in sessions_class:
+            if session_class.name() == model_name:
+                return session_class.download_models()
+        return self._new_rembg_session(model_name).download_models()
+
+    def _new_rembg_session(self, model_name: str):
+        """
+        Create a rembg session with our ONNX Runtime options.
+
+        rembg's new_session builds its own default SessionOptions, so the
+        session class is constructed directly when it can be found.
+        """
+        sess_opts = self._ort_session_options(os.cpu_count() or 1)
+        for session_class in sessions_class:
+            if session_class.name() == model_name:
+                return session_class(model_name, sess_opts, self.ORT_PROVIDERS)
+        return new_session(model_name, self.ORT_PROVIDERS)
+
+    def _new_u2net_session(self, intra_op_threads: Optional[int] = None) -> ort.InferenceSession:
+        """Open an onnxruntime session on the fast U2-Net model (INT8 on CPU, FP32 on CUDA)."""
+        return ort.InferenceSession(
+            self._u2net_path,
+            sess_options=self._ort_session_options(intra_op_threads or os.cpu_count() or 1),
+            providers=self._u2net_providers
+        )
+
+    def _init_segment_worker(self):
+        """Mark a pool thread as a segmentation worker; its U2-Net session opens on first use."""
+        self._seg_local.session = None
+
+    def _thread_u2net(self) -> ort.InferenceSession:
+        """U2-Net session for the calling thread: pool workers get their own, others share one."""
+        shared = self._get_u2net()
+        if not hasattr(self._seg_local, "session"):
+            return shared
+        if self._seg_local.session is None:
+            # Split the cores between workers so parallel faces don't oversubscribe
+            threads = max(1, (os.cpu_count() or 1) // self.SEGMENTATION_WORKERS)
+            self._seg_local.session = self._new_u2net_session(threads)
+        return self._seg_local.session
+
+    def _seg_blob(self, crop: np.ndarray, size: int) -> np.ndarray:
+        """Resize and normalize a crop (RGB) into a 3 x size x size model input."""
+        resized = cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+        resized /= max(resized.max(), 1.0)
+        resized -= self.SEG_MEAN
+        resized /= self.SEG_STD
+        return resized.transpose(2, 0, 1)
+
+    def _seg_mask(self, pred: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+        """Turn one square model prediction into a 0-255 mask of the given shape."""
+        # Stretch the prediction to the full 0-255 range, as rembg does
+        lo, hi = pred.min(), pred.max()
+        pred = (pred - lo) * (255.0 / max(hi - lo, 1e-6))
+        return cv2.resize(pred.astype(np.uint8), (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+
+    def _run_u2net(self, crop: np.ndarray) -> np.ndarray:
+        """
+        Predict a person mask with the fast U2-Net model.
+
+        Args:
+            crop: Image region to segment (RGB)
+
+        Returns:
+            Alpha mask (0-255) at the crop's resolution
+        """
+        session = self._thread_u2net()
+        blob = self._seg_blob(crop, self.U2NET_INPUT_SIZE)[np.newaxis]
+        pred = session.run(None, {session.get_inputs()[0].name: blob})[0][0, 0]
+        return self._seg_mask(pred, crop.shape)
+
+    def _run_u2net_batch(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Predict person masks for several crops in one U2-Net inference.
+
+        Args:
+            crops: Image regions to segment (RGB), any sizes
+
+        Returns:
+            Alpha masks (0-255), each at its crop's resolution
+        """
+        blob = np.stack([self._seg_blob(crop, self.U2NET_INPUT_SIZE) for crop in crops])
+        session = self._get_u2net()
+        preds = session.run(None, {session.get_inputs()[0].name: blob})[0]
+        return [self._seg_mask(pred[0], crop.shape) for pred, crop in zip(preds, crops)]
+
+    def _run_birefnet(self, crop: np.ndarray) -> np.ndarray:
+        """
+        Predict a person mask with the BiRefNet model, bypassing rembg's PIL path.
+
+        Args:
+            crop: Image region to segment (RGB)
+
+        Returns:
+            Alpha mask (0-255) at the crop's resolution
+        """
+        session = self.seg_session_hq.inner_session
+        blob = self._seg_blob(crop, self.BIREFNET_INPUT_SIZE)[np.newaxis]
+        logits = session.run(None, {session.get_inputs()[0].name: blob})[0][0, 0]
+        return self._seg_mask(1.0 / (1.0 + np.exp(-logits)), crop.shape)
+
+    def _body_region(
+        self,
+        shape: Tuple[int, ...],
+        face_location: Tuple[int, int, int, int]
+    ) -> Tuple[int, int, int, int]:
+        """
+        Estimate the body box below a face, clipped to the image.
+
+        Args:
+            shape: Image shape (height, width, ...)
+            face_location: Face location (top, right, bottom, left) from face_recognition
+
+        Returns:
+            Body box (x1, y1, x2, y2)
+        """
+        h, w = shape[:2]
+        top, right, bottom, left = face_location
+
+        # Expand bounding box to capture more of the person
+        face_width = right - left
+        face_height = bottom - top
+
+        return (
+            max(0, left - face_width),
+            max(0, top - int(face_height * 0.5)),
+            min(w, right + face_width),
+            min(h, bottom + int(face_height * 6))  # Extend down for body
+        )
+
+    def _segment_people(
+        self,
+        image: np.ndarray,
+        face_locations: List[Tuple[int, int, int, int]]
+    ) -> List[np.ndarray]:
+        """
+        Segment several people at once, one full-size mask per face.
+
+        All body crops go through U2-Net as a single batch when the model
+        accepts one; a model exported with a fixed batch of 1 falls back
+        to the per-face pool.
+
+        Args:
+            image: Input image (RGB)
+            face_locations: Face locations (top, right, bottom, left)
+
+        Returns:
+            Masks of the segmented people, in face order
+        """
+        if not face_locations:
+            return []
+        self._get_u2net()  # loads the model and sets _u2net_batched
+        if not self._u2net_batched or len(face_locations) == 1:
+            return list(self._seg_executor.map(
+                lambda face_location: self._segment_person(image, face_location),
+                face_locations
+            ))
+
+        h, w = image.shape[:2]
+        boxes = [self._body_region(image.shape, face_location) for face_location in face_locations]
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+
+        masks = []
+        for (x1, y1, x2, y2), mask in zip(boxes, self._run_u2net_batch(crops)):
+            full_mask = np.zeros((h, w), dtype=np.uint8)
+            full_mask[y1:y2, x1:x2] = mask
+            masks.append(full_mask)
+        return masks
+
     def _segment_person(
         self,
         image: np.ndarray,
@@ -270,25 +1007,11 @@ class CelebrityPipeline:
             Binary mask of the segmented person
         """
         h, w = image.shape[:2]
-        top, right, bottom, left = face_location
-
-        # Expand bounding box to capture more of the person
-        face_width = right - left
-        face_height = bottom - top
-
-        # Estimate body region based on face position
-        body_x1 = max(0, left - face_width)
-        body_y1 = max(0, top - int(face_height * 0.5))
-        body_x2 = min(w, right + face_width)
-        body_y2 = min(h, bottom + int(face_height * 6))  # Extend down for body
+        body_x1, body_y1, body_x2, body_y2 = self._body_region(image.shape, face_location)
 
         # Crop and segment
         crop = image[body_y1:body_y2, body_x1:body_x2]
-        pil_crop = Image.fromarray(crop)
-
-        # Get mask using rembg
-        result = remove(pil_crop, session=self.seg_session, only_mask=True)
-        mask = np.array(result)
+        mask = self._run_u2net(crop)
 
         # Create full-size mask
         full_mask = np.zeros((h, w), dtype=np.uint8)
@@ -311,95 +1034,199 @@ class CelebrityPipeline:
         self,
         width: int,
         height: int,
-        color_hex: str
+        color_rgb: Tuple[int, int, int],
+        bgr: bool = False
     ) -> np.ndarray:
-        """Create a B99-style gradient background."""
-        # Normalize color format
-        if not color_hex.startswith('#'):
-            color_hex = '#' + color_hex
-
-        if color_hex in self.B99_BACKGROUNDS:
-            color1, color2 = self.B99_BACKGROUNDS[color_hex]
+        """Create a B99-style gradient background (a fresh, writable array, RGB or BGR)."""
+        if color_rgb in self._b99_backgrounds_rgb:
+            color1, color2 = self._b99_backgrounds_rgb[color_rgb]
         else:
             # Fallback gradient
             color1 = (20, 20, 30)
-            color2 = self._hex_to_rgb(color_hex)
-
-        # Create vertical gradient
-        gradient = np.zeros((height, width, 3), dtype=np.uint8)
-        for y in range(height):
-            ratio = y / height
-            r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-            g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-            b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-            gradient[y, :] = [r, g, b]
-
-        return gradient
-
-    def _draw_improved_edge(
+            color2 = color_rgb
+        if bgr:
+            color1, color2 = color1[::-1], color2[::-1]
+
+        # Create vertical gradient: lerp one column of rows, then broadcast across width
+        ratio = (np.arange(height, dtype=np.float32) / height)[:, None]
+        c1 = np.array(color1, dtype=np.float32)
+        c2 = np.array(color2, dtype=np.float32)
+        column = (c1 * (1 - ratio) + c2 * ratio).astype(np.uint8)
+        return np.broadcast_to(column[:, None, :], (height, width, 3)).copy()
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _ellipse_kernel(radius: int) -> np.ndarray:
+        """Elliptical structuring element of the given radius, built once."""
+        return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _text_size(text: str, font: int, font_scale: float, thickness: int) -> Tuple[Tuple[int, int], int]:
+        """Memoized cv2.getTextSize; labels repeat the same names and sizes."""
+        return cv2.getTextSize(text, font, font_scale, thickness)
+
+    @staticmethod
+    def _output_buffer(image: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+        """Pick the array a drawing helper writes into: out (may be image) or a copy."""
+        if out is None:
+            return image.copy()
+        if out is not image:
+            np.copyto(out, image)
+        return out
+
+    def _edge_layers(
         self,
-        image: np.ndarray,
         mask: np.ndarray,
-        color_hex: str,
         thickness: int = 6,
         glow_size: int = 15
-    ) -> np.ndarray:
+    ) -> Optional[Tuple]:
         """
-        Draw an improved colored edge with glow effect.
+        Compute where an edge's glow, solid ring and highlight go.
+
+        Only the mask is read, so layers for several people can be
+        computed in parallel and painted afterwards.
 
         Args:
-            image: Input image (BGR)
             mask: Binary/alpha mask of the person
-            color_hex: Hex color code for the edge
             thickness: Edge thickness in pixels
             glow_size: Size of the outer glow
 
         Returns:
-            Image with colored edge drawn
+            (roi box, glow band, glow weights, ring, highlight) or None for an empty mask
         """
-        bgr = self._hex_to_bgr(color_hex)
-
-        # Threshold mask if it's alpha (0-255)
-        if mask.max() > 1:
-            binary_mask = (mask > 127).astype(np.uint8) * 255
-        else:
-            binary_mask = mask
+        # Threshold to 0/255: at mid-level if it's alpha (0-255), else any nonzero
+        threshold = 127 if mask.max() > 1 else 0
+        _, binary_mask = cv2.threshold(mask, threshold, 255, cv2.THRESH_BINARY)
+
+        # Everything below only touches the person's box, padded by the
+        # glow reach; pixels further out keep the image unchanged
+        reach = thickness / 2 + glow_size
+        pad = int(np.ceil(reach)) + thickness + 2
+        x, y, w, h = cv2.boundingRect(binary_mask)
+        if not w:
+            return None
+        y0, y1 = max(0, y - pad), min(mask.shape[0], y + h + pad)
+        x0, x1 = max(0, x - pad), min(mask.shape[1], x + w + pad)
+
+        binary_mask = binary_mask[y0:y1, x0:x1]
+        if self.use_opencl:
+            binary_mask = cv2.UMat(np.ascontiguousarray(binary_mask))
+
+        # Smooth the mask edges (removes speckle, keeps the mask binary)
+        binary_mask = cv2.medianBlur(binary_mask, 5)
+
+        if not cv2.countNonZero(binary_mask):
+            return None
+
+        # Edge bands come straight from morphology instead of contour tracing:
+        # a one-pixel boundary line for the glow, a thickness-wide ring for
+        # the solid edge and a thin band just inside it for the highlight
+        boundary = cv2.subtract(binary_mask, cv2.erode(binary_mask, self._k3))
+        ring = cv2.morphologyEx(binary_mask, cv2.MORPH_GRADIENT, self._ellipse_kernel(thickness // 2))
+        inner = cv2.subtract(
+            binary_mask,
+            cv2.erode(binary_mask, self._k3, iterations=max(1, thickness // 4))
+        )
 
-        # Smooth the mask edges
-        binary_mask = cv2.GaussianBlur(binary_mask, (5, 5), 0)
-        _, binary_mask = cv2.threshold(binary_mask, 127, 255, cv2.THRESH_BINARY)
+        # Create glow effect from the distance to the boundary, fading out
+        # over the band the solid edge plus glow_size covers. The glow is
+        # zero beyond reach, so only that band is kept
+        dist = self._to_host(cv2.distanceTransform(cv2.bitwise_not(boundary), cv2.DIST_L2, 3))
+        band = dist < reach
+        glow = (1.0 - dist[band] / reach)[:, None] * 0.5
+
+        return (y0, y1, x0, x1), band, glow, self._to_host(ring) > 0, self._to_host(inner) > 0
+
+    @staticmethod
+    def _to_host(array) -> np.ndarray:
+        """Download a UMat to a NumPy array; arrays pass through."""
+        return array.get() if isinstance(array, cv2.UMat) else array
+
+    def _init_opencl(self) -> bool:
+        """Turn on OpenCV's OpenCL path if a device is usable, else leave it off."""
+        try:
+            if not cv2.ocl.haveOpenCL():
+                return False
+            cv2.ocl.setUseOpenCL(True)
+            # Round-trip a UMat so a broken driver fails here, not mid-request
+            cv2.erode(cv2.UMat(np.zeros((8, 8), dtype=np.uint8)), self._k3).get()
+            return cv2.ocl.useOpenCL()
+        except cv2.error as e:
+            print(f"OpenCL unavailable: {e}")
+            cv2.ocl.setUseOpenCL(False)
+            return False
+
+    def _paint_edge(
+        self,
+        image: np.ndarray,
+        layers: Optional[Tuple],
+        color: Tuple[int, int, int],
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Paint edge layers from _edge_layers onto an image.
 
-        # Find contours
-        contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        Args:
+            image: Input image (BGR or RGB)
+            layers: Result of _edge_layers (None draws nothing)
+            color: Edge color in the same channel order as image
+            out: Array to draw into (may be image itself); a new one if None
 
-        if not contours:
-            return image
+        Returns:
+            Image with colored edge drawn
+        """
+        if layers is None:
+            return image if out is None else self._output_buffer(image, out)
 
-        result = image.copy()
+        (y0, y1, x0, x1), band, glow, ring, inner = layers
+        result = self._output_buffer(image, out)
+        roi = result[y0:y1, x0:x1]
 
-        # Create glow effect using dilated contours with decreasing opacity
-        for i in range(glow_size, 0, -2):
-            overlay = result.copy()
-            cv2.drawContours(overlay, contours, -1, bgr, thickness + i * 2)
-            alpha = 0.05 + (0.15 * (glow_size - i) / glow_size)
-            result = cv2.addWeighted(overlay, alpha, result, 1 - alpha, 0)
+        # Blend the glow, leaving the person's interior untouched
+        color_layer = np.array(color, dtype=np.float32)
+        roi[band] = roi[band] * (1 - glow) + color_layer * glow
 
         # Draw main solid edge
-        cv2.drawContours(result, contours, -1, bgr, thickness)
+        roi[ring] = color
 
         # Draw thin white highlight on the inside
-        dilated_mask = cv2.dilate(binary_mask, np.ones((3, 3), np.uint8), iterations=1)
-        inner_contours, _ = cv2.findContours(dilated_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        cv2.drawContours(result, inner_contours, -1, (255, 255, 255), max(1, thickness // 4))
+        roi[inner] = (255, 255, 255)
 
         return result
 
+    def _draw_improved_edge(
+        self,
+        image: np.ndarray,
+        mask: np.ndarray,
+        color: Tuple[int, int, int],
+        thickness: int = 6,
+        glow_size: int = 15,
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Draw an improved colored edge with glow effect.
+
+        Args:
+            image: Input image (BGR or RGB)
+            mask: Binary/alpha mask of the person
+            color: Edge color in the same channel order as image
+            thickness: Edge thickness in pixels
+            glow_size: Size of the outer glow
+            out: Array to draw into (may be image itself); a new one if None
+
+        Returns:
+            Image with colored edge drawn
+        """
+        return self._paint_edge(image, self._edge_layers(mask, thickness, glow_size), color, out=out)
+
     def _draw_colored_edge(
         self,
         image: np.ndarray,
         mask: np.ndarray,
-        color_hex: str,
-        thickness: int = 5
+        color: Tuple[int, int, int],
+        thickness: int = 5,
+        out: Optional[np.ndarray] = None
     ) -> np.ndarray:
         """
         Draw a colored edge/outline around a segmented person.
@@ -407,20 +1234,48 @@ class CelebrityPipeline:
         Args:
             image: Input image (BGR)
             mask: Binary mask of the person
-            color_hex: Hex color code for the edge
+            color: Edge color as a (B, G, R) tuple
             thickness: Edge thickness in pixels
+            out: Array to draw into (may be image itself); a new one if None
 
         Returns:
             Image with colored edge drawn
         """
-        return self._draw_improved_edge(image, mask, color_hex, thickness)
+        return self._draw_improved_edge(image, mask, color, thickness, out=out)
+
+    def _draw_bbox_edge(
+        self,
+        image: np.ndarray,
+        face_location: Tuple[int, int, int, int],
+        color: Tuple[int, int, int],
+        thickness: int = 3,
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Outline a face with a colored box, for matches not worth segmenting.
+
+        Args:
+            image: Input image (BGR)
+            face_location: Face location (top, right, bottom, left)
+            color: Box color as a (B, G, R) tuple
+            thickness: Box line thickness in pixels
+            out: Array to draw into (may be image itself); a new one if None
+
+        Returns:
+            Image with the box drawn
+        """
+        result = self._output_buffer(image, out)
+        top, right, bottom, left = face_location
+        cv2.rectangle(result, (left, top), (right, bottom), color, thickness, cv2.LINE_AA)
+        return result
 
     def _add_name_label(
         self,
         image: np.ndarray,
         name: str,
         face_location: Tuple[int, int, int, int],
-        color_hex: str
+        color: Tuple[int, int, int],
+        out: Optional[np.ndarray] = None
     ) -> np.ndarray:
         """
         Add a stylized name label near the person.
@@ -429,12 +1284,13 @@ class CelebrityPipeline:
             image: Input image (BGR)
             name: Celebrity name to display
             face_location: Face location (top, right, bottom, left)
-            color_hex: Matching color for the label
+            color: Matching label color as a (B, G, R) tuple
+            out: Array to draw into (may be image itself); a new one if None
 
         Returns:
             Image with name label added
         """
-        bgr = self._hex_to_bgr(color_hex)
+        bgr = color
 
         top, right, bottom, left = face_location
         center_x = (left + right) // 2
@@ -446,7 +1302,7 @@ class CelebrityPipeline:
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.9
         thickness = 2
-        (text_w, text_h), baseline = cv2.getTextSize(name, font, font_scale, thickness)
+        (text_w, text_h), baseline = self._text_size(name, font, font_scale, thickness)
 
         # Calculate pill/badge dimensions
         padding_x = 15
@@ -456,41 +1312,88 @@ class CelebrityPipeline:
         pill_y1 = label_y - text_h - padding_y
         pill_y2 = label_y + padding_y + baseline
 
-        result = image.copy()
+        result = self._output_buffer(image, out)
 
-        # Draw shadow
+        # The pill is rendered once per name, color and size, then pasted;
+        # the sprite starts one pixel outside the pill for its border
+        text_x = center_x - text_w // 2
+        sprite, mask = self._label_sprite(
+            name, bgr, pill_x2 - pill_x1, pill_y2 - pill_y1,
+            text_x - pill_x1, label_y - pill_y1, font, font_scale, thickness
+        )
+        self._paste_sprite(result, sprite, mask, pill_x1 - 1, pill_y1 - 1)
+
+        return result
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _label_sprite(
+        name: str,
+        color: Tuple[int, int, int],
+        pill_w: int,
+        pill_h: int,
+        text_x: int,
+        text_y: int,
+        font: int,
+        font_scale: float,
+        thickness: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Render a name pill (shadow, background, border, text) into a sprite.
+
+        Returns:
+            Tuple of (BGR sprite, 0/255 mask of drawn pixels), both read-only
+        """
         shadow_offset = 3
+        canvas = np.zeros((pill_h + shadow_offset + 3, pill_w + shadow_offset + 3, 4), dtype=np.uint8)
+        x1, y1, x2, y2 = 1, 1, 1 + pill_w, 1 + pill_h
+        text_x += x1
+        text_y += y1
+
+        # Draw shadow
         cv2.rectangle(
-            result,
-            (pill_x1 + shadow_offset, pill_y1 + shadow_offset),
-            (pill_x2 + shadow_offset, pill_y2 + shadow_offset),
-            (30, 30, 30),
+            canvas,
+            (x1 + shadow_offset, y1 + shadow_offset),
+            (x2 + shadow_offset, y2 + shadow_offset),
+            (30, 30, 30, 255),
             -1
         )
 
         # Draw main pill background
-        cv2.rectangle(result, (pill_x1, pill_y1), (pill_x2, pill_y2), bgr, -1)
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (*color, 255), -1)
 
         # Draw border
-        cv2.rectangle(result, (pill_x1, pill_y1), (pill_x2, pill_y2), (255, 255, 255), 2)
-
-        # Draw text
-        text_x = center_x - text_w // 2
-        text_y = label_y
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (255, 255, 255, 255), 2)
 
         # Text shadow
-        cv2.putText(result, name, (text_x + 1, text_y + 1), font, font_scale, (0, 0, 0), thickness + 1)
+        cv2.putText(canvas, name, (text_x + 1, text_y + 1), font, font_scale, (0, 0, 0, 255), thickness + 1)
         # Main text
-        cv2.putText(result, name, (text_x, text_y), font, font_scale, (255, 255, 255), thickness)
-
-        return result
+        cv2.putText(canvas, name, (text_x, text_y), font, font_scale, (255, 255, 255, 255), thickness)
+
+        sprite = np.ascontiguousarray(canvas[..., :3])
+        mask = np.ascontiguousarray(canvas[..., 3])
+        sprite.flags.writeable = False
+        mask.flags.writeable = False
+        return sprite, mask
+
+    @staticmethod
+    def _paste_sprite(image: np.ndarray, sprite: np.ndarray, mask: np.ndarray, x: int, y: int):
+        """Copy a sprite's drawn pixels onto image with its top-left at (x, y), clipped to the image."""
+        h, w = mask.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, image.shape[1]), min(y + h, image.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        # cv2.copyTo writes through into the image's ROI view
+        cv2.copyTo(sprite[y0 - y:y1 - y, x0 - x:x1 - x], mask[y0 - y:y1 - y, x0 - x:x1 - x], image[y0:y1, x0:x1])
 
     def _add_b99_name_label(
         self,
         image: np.ndarray,
         name: str,
-        color_hex: str,
-        position: str = "bottom"
+        color: Tuple[int, int, int],
+        position: str = "bottom",
+        out: Optional[np.ndarray] = None
     ) -> np.ndarray:
         """
         Add Brooklyn Nine-Nine style name label.
@@ -498,14 +1401,15 @@ class CelebrityPipeline:
         Args:
             image: Input image (BGR or RGB)
             name: Name to display
-            color_hex: Color for the name
+            color: Color for the name in the same channel order as image
             position: "bottom" or "center"
+            out: Array to draw into (may be image itself); a new one if None
 
         Returns:
             Image with B99-style name
         """
         h, w = image.shape[:2]
-        result = image.copy()
+        result = self._output_buffer(image, out)
 
         # Use a large, bold font
         font = cv2.FONT_HERSHEY_SIMPLEX
@@ -513,7 +1417,7 @@ class CelebrityPipeline:
         thickness = max(2, int(font_scale * 2))
 
         # Get text size
-        (text_w, text_h), baseline = cv2.getTextSize(name.upper(), font, font_scale, thickness)
+        (text_w, text_h), baseline = self._text_size(name.upper(), font, font_scale, thickness)
 
         # Position
         if position == "bottom":
@@ -523,18 +1427,26 @@ class CelebrityPipeline:
             text_x = (w - text_w) // 2
             text_y = (h + text_h) // 2
 
-        # Draw text shadow (multiple layers for depth)
-        for offset in range(8, 0, -2):
-            shadow_alpha = 0.3 - (offset * 0.03)
-            overlay = result.copy()
-            cv2.putText(overlay, name.upper(), (text_x + offset, text_y + offset),
-                       font, font_scale, (0, 0, 0), thickness + 2)
-            result = cv2.addWeighted(overlay, shadow_alpha, result, 1 - shadow_alpha, 0)
+        # Draw a soft drop shadow: render the text once into a small patch
+        # around the label, blur it and darken only that region
+        offset = 5
+        margin = 16
+        x0 = max(0, text_x - margin)
+        y0 = max(0, text_y - text_h - margin)
+        x1 = min(w, text_x + text_w + offset + margin)
+        y1 = min(h, text_y + baseline + offset + margin)
+        if x1 > x0 and y1 > y0:
+            shadow = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.putText(shadow, name.upper(), (text_x + offset - x0, text_y + offset - y0),
+                       font, font_scale, 255, thickness + 2)
+            shadow = cv2.GaussianBlur(shadow, (0, 0), 3)
+            roi = result[y0:y1, x0:x1]
+            shade = 1.0 - shadow[..., None].astype(np.float32) * (0.5 / 255)
+            np.copyto(roi, (roi * shade).astype(np.uint8))
 
         # Main text with color
-        rgb = self._hex_to_rgb(color_hex)
         cv2.putText(result, name.upper(), (text_x, text_y), font, font_scale,
-                   rgb, thickness)
+                   color, thickness)
 
         # White outline for pop
         cv2.putText(result, name.upper(), (text_x, text_y), font, font_scale,
@@ -542,7 +1454,7 @@ class CelebrityPipeline:
 
         return result
 
-    def process(self, image: np.ndarray) -> Dict:
+    def process(self, image: np.ndarray, inplace: bool = False) -> Dict:
         """
         Main processing pipeline.
 
@@ -554,6 +1466,8 @@ class CelebrityPipeline:
 
         Args:
             image: Input image (BGR format from OpenCV)
+            inplace: Draw on image itself rather than a copy, for callers
+                that no longer need the original
 
         Returns:
             Dictionary containing:
@@ -562,57 +1476,66 @@ class CelebrityPipeline:
         """
         results = {
             "matches": [],
-            "annotated_image": image.copy()
+            "annotated_image": image if inplace else image.copy()
         }
 
+        # Nothing can match an empty database
+        if not self.celeb_ids:
+            return results
+
         # Convert BGR to RGB for face_recognition
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
         # Detect faces
-        face_locations = face_recognition.face_locations(rgb_image)
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+        face_locations = self._detect_faces(rgb_image, model=self._detection_model)
+        face_encodings = self._encode_faces(rgb_image, face_locations)
 
         if not face_locations:
             return results
 
-        # Process each face
-        color_idx = 0
+        # Match each face against the celebrity database
+        identified = []
         for face_location, face_encoding in zip(face_locations, face_encodings):
-            # Try to match with celebrity database
             match = self._match_face(face_encoding)
-
             if match:
-                celeb_id, name, confidence = match
-                color = self.COLORS[color_idx % len(self.COLORS)]
-                color_idx += 1
+                identified.append((face_location, *match, len(identified) % len(self.COLORS)))
 
-                # Segment the person
-                mask = self._segment_person(rgb_image, face_location)
+        # Segment confident matches in one batch; the rest only get a box
+        confident = [face[0] for face in identified if face[3] >= self.seg_threshold]
+        masks = self._segment_people(rgb_image, confident)
 
-                # Draw colored edge
-                results["annotated_image"] = self._draw_colored_edge(
-                    results["annotated_image"], mask, color
-                )
+        # Work out each person's edge concurrently (mask-only OpenCV work);
+        # thickness matches _draw_colored_edge
+        edges = self._seg_executor.map(lambda mask: self._edge_layers(mask, thickness=5), masks)
 
-                # Add name label
-                results["annotated_image"] = self._add_name_label(
-                    results["annotated_image"], name, face_location, color
-                )
+        # Draw edges and labels sequentially, in place on the one annotated copy
+        annotated = results["annotated_image"]
+        for face_location, celeb_id, name, confidence, color_idx in identified:
+            bgr = self._palette_bgr[color_idx]
 
-                # Convert face_location to bbox format
-                top, right, bottom, left = face_location
-                results["matches"].append({
-                    "celebrity_id": celeb_id,
-                    "name": name,
-                    "confidence": confidence,
-                    "color": color,
-                    "bbox": {
-                        "x": left,
-                        "y": top,
-                        "width": right - left,
-                        "height": bottom - top
-                    }
-                })
+            # Draw colored edge
+            if confidence >= self.seg_threshold:
+                self._paint_edge(annotated, next(edges), bgr, out=annotated)
+            else:
+                self._draw_bbox_edge(annotated, face_location, bgr, out=annotated)
+
+            # Add name label
+            self._add_name_label(annotated, name, face_location, bgr, out=annotated)
+
+            # Convert face_location to bbox format
+            top, right, bottom, left = face_location
+            results["matches"].append({
+                "celebrity_id": celeb_id,
+                "name": name,
+                "confidence": confidence,
+                "color": self.COLORS[color_idx],
+                "bbox": {
+                    "x": left,
+                    "y": top,
+                    "width": right - left,
+                    "height": bottom - top
+                }
+            })
 
         return results
 
@@ -636,8 +1559,12 @@ class CelebrityPipeline:
 
         # Use faster model for real-time (CNN vs HOG)
         # HOG is faster, CNN is more accurate
-        face_locations = face_recognition.face_locations(rgb_image, model="hog")
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+        face_locations = self._detect_faces(rgb_image, model="hog")
+        # Faces are still reported with an empty database, but need no encodings
+        if self.celeb_ids:
+            face_encodings = self._encode_faces(rgb_image, face_locations)
+        else:
+            face_encodings = [None] * len(face_locations)
 
         color_idx = 0
         for face_location, face_encoding in zip(face_locations, face_encodings):
@@ -674,8 +1601,9 @@ class CelebrityPipeline:
         self,
         image: np.ndarray,
         face_box: Dict[str, int],
-        color_hex: str,
-        name: str
+        color_rgb: Tuple[int, int, int],
+        name: str,
+        quality: str = "fast"
     ) -> Dict:
         """
         Generate Brooklyn Nine-Nine style cutout.
@@ -683,13 +1611,57 @@ class CelebrityPipeline:
         Args:
             image: Input image (BGR)
             face_box: Face bounding box {x, y, width, height}
-            color_hex: Color theme for the cutout
+            color_rgb: Color theme for the cutout as an (R, G, B) tuple
             name: Celebrity name
+            quality: "high" adds alpha matting to the segmentation (much slower)
 
         Returns:
             Dictionary with:
-            - cutout_image: RGBA image of just the person
-            - presentation_image: Full B99-style presentation
+            - cutout_bgra: BGRA image of just the person (ready for cv2.imencode)
+            - presentation_bgr: Full B99-style presentation (ready for cv2.imencode)
+        """
+        alpha, crop_box = self._segment_cutout(image, face_box, quality)
+        return self._compose_cutout(image, alpha, crop_box, color_rgb, name)
+
+    async def generate_cutout_async(
+        self,
+        image: np.ndarray,
+        face_box: Dict[str, int],
+        color_rgb: Tuple[int, int, int],
+        name: str,
+        quality: str = "fast"
+    ) -> Dict:
+        """
+        Generate a cutout through the two-stage segmentation/compositing pipeline.
+
+        Same arguments and result as generate_cutout. Each stage runs on its
+        own worker thread, so concurrent requests overlap instead of queueing
+        behind each other's full run.
+        """
+        loop = asyncio.get_running_loop()
+        alpha, crop_box = await loop.run_in_executor(
+            self._cutout_seg_executor, self._segment_cutout, image, face_box, quality
+        )
+        return await loop.run_in_executor(
+            self._cutout_compose_executor, self._compose_cutout, image, alpha, crop_box, color_rgb, name
+        )
+
+    def _segment_cutout(
+        self,
+        image: np.ndarray,
+        face_box: Dict[str, int],
+        quality: str = "fast"
+    ) -> Tuple[np.ndarray, Tuple[int, int, int, int]]:
+        """
+        Segmentation stage of generate_cutout.
+
+        Args:
+            image: Input image (BGR)
+            face_box: Face bounding box {x, y, width, height}
+            quality: "fast" or "high" (see _segment_person_high_quality)
+
+        Returns:
+            Tuple of (alpha mask 0-255, crop_box)
         """
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
@@ -702,16 +1674,40 @@ class CelebrityPipeline:
         )
 
         # High-quality segmentation
-        alpha, crop_box = self._segment_person_high_quality(rgb_image, face_location)
+        return self._segment_person_high_quality(rgb_image, face_location, quality=quality)
+
+    def _compose_cutout(
+        self,
+        image: np.ndarray,
+        alpha: np.ndarray,
+        crop_box: Tuple[int, int, int, int],
+        color_rgb: Tuple[int, int, int],
+        name: str
+    ) -> Dict:
+        """
+        Compositing stage of generate_cutout: cutout, background, edge and label.
+
+        Args:
+            image: Input image (BGR)
+            alpha: Alpha mask from _segment_cutout
+            crop_box: Crop box from _segment_cutout
+            color_rgb: Color theme for the cutout as an (R, G, B) tuple
+            name: Celebrity name
+
+        Returns:
+            Same dictionary as generate_cutout
+        """
         x1, y1, x2, y2 = crop_box
 
-        # Get cropped person
-        person_crop = rgb_image[y1:y2, x1:x2].copy()
+        # Get cropped person; both outputs are composed in BGR straight from
+        # the input, so the RGB copy is only needed for segmentation
+        person_crop = image[y1:y2, x1:x2]
+        color_bgr = color_rgb[::-1]
 
-        # Create RGBA cutout
-        cutout_rgba = np.zeros((person_crop.shape[0], person_crop.shape[1], 4), dtype=np.uint8)
-        cutout_rgba[:, :, :3] = person_crop
-        cutout_rgba[:, :, 3] = alpha
+        # Create BGRA cutout
+        cutout_bgra = np.empty((person_crop.shape[0], person_crop.shape[1], 4), dtype=np.uint8)
+        cutout_bgra[:, :, :3] = person_crop
+        cutout_bgra[:, :, 3] = alpha
 
         # Create B99-style presentation
         # Calculate dimensions - make it portrait oriented
@@ -720,7 +1716,7 @@ class CelebrityPipeline:
         target_w = max(crop_w, int(target_h * 0.7))
 
         # Create gradient background
-        background = self._create_gradient_background(target_w, target_h, color_hex)
+        background = self._create_gradient_background(target_w, target_h, color_rgb, bgr=True)
 
         # Calculate position to center the person
         paste_x = (target_w - crop_w) // 2
@@ -731,33 +1727,31 @@ class CelebrityPipeline:
         if paste_y < 0:
             paste_y = 0
 
-        # Create presentation with alpha blending
-        presentation = background.copy()
-
-        # Blend person onto background using alpha
-        alpha_normalized = alpha.astype(float) / 255.0
+        # Create presentation with alpha blending (background is freshly built, blend in place)
+        presentation = background
 
-        for c in range(3):
-            region = presentation[paste_y:paste_y+crop_h, paste_x:paste_x+crop_w, c]
-            person_channel = person_crop[:, :, c]
-            blended = (person_channel * alpha_normalized + region * (1 - alpha_normalized))
-            presentation[paste_y:paste_y+crop_h, paste_x:paste_x+crop_w, c] = blended.astype(np.uint8)
+        # Blend person onto background in one pass using fixed-point math:
+        # (fg * a + bg * (255 - a)) / 255 with rounding, all in uint16
+        region = presentation[paste_y:paste_y+crop_h, paste_x:paste_x+crop_w]
+        a = alpha[..., None].astype(np.uint16)
+        blended = person_crop.astype(np.uint16) * a + region.astype(np.uint16) * (255 - a)
+        blended += 128
+        blended += blended >> 8
+        np.copyto(region, (blended >> 8).astype(np.uint8))
 
         # Draw stylized edge around person in presentation
         presentation_mask = np.zeros((target_h, target_w), dtype=np.uint8)
         presentation_mask[paste_y:paste_y+crop_h, paste_x:paste_x+crop_w] = alpha
-        presentation = self._draw_improved_edge(presentation, presentation_mask, color_hex, thickness=4, glow_size=20)
+        self._draw_improved_edge(
+            presentation, presentation_mask, color_bgr, thickness=4, glow_size=20, out=presentation
+        )
 
         # Add B99-style name
-        presentation = self._add_b99_name_label(presentation, name, color_hex)
-
-        # Convert presentation to BGR for encoding
-        presentation_bgr = cv2.cvtColor(presentation, cv2.COLOR_RGB2BGR)
+        self._add_b99_name_label(presentation, name, color_bgr, out=presentation)
 
         return {
-            "cutout_rgba": cutout_rgba,
-            "presentation_rgb": presentation,
-            "presentation_bgr": presentation_bgr
+            "cutout_bgra": cutout_bgra,
+            "presentation_bgr": presentation
         }
 
     def get_face_encoding(self, image: np.ndarray) -> Optional[np.ndarray]:
@@ -771,7 +1765,7 @@ class CelebrityPipeline:
             128-dimensional face embedding or None if no face detected
         """
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        face_encodings = face_recognition.face_encodings(rgb_image)
+        face_encodings = self._encode_faces(rgb_image, face_recognition.face_locations(rgb_image)[:1])
 
         if face_encodings:
             return face_encodings[0]
@@ -33,7 +33,7 @@ struct CelebrityMatch: Codable, Identifiable {
 }
 
 struct RecognitionResponse: Codable {
-    let annotatedImage: String  // Base64 encoded PNG
+    let annotatedImage: Data  // PNG bytes (base64 in the JSON endpoint)
     let celebrities: [CelebrityMatch]
 
     enum CodingKeys: String, CodingKey {
@@ -94,7 +94,7 @@ struct FastRecognitionResponse: Codable {
 
 struct CutoutResponse: Codable {
     let cutoutImage: String  // Base64 PNG with transparency
-    let presentationImage: String  // Base64 PNG of B99-style presentation
+    let presentationImage: String  // Base64 JPEG of B99-style presentation
 
     enum CodingKeys: String, CodingKey {
         case cutoutImage = "cutout_image"
@@ -57,7 +57,8 @@ class APIService {
             throw APIError.invalidImage
         }
 
-        guard let url = URL(string: "\(baseURL)/recognize") else {
+        // Binary endpoint: raw PNG body, matches in the X-Celebrities header
+        guard let url = URL(string: "\(baseURL)/recognize/binary") else {
             throw APIError.invalidURL
         }
 
@@ -91,8 +92,10 @@ class APIService {
                 throw APIError.serverError(httpResponse.statusCode)
             }
 
+            let celebritiesJSON = httpResponse.value(forHTTPHeaderField: "X-Celebrities") ?? "[]"
             let decoder = JSONDecoder()
-            return try decoder.decode(RecognitionResponse.self, from: data)
+            let celebrities = try decoder.decode([CelebrityMatch].self, from: Data(celebritiesJSON.utf8))
+            return RecognitionResponse(annotatedImage: data, celebrities: celebrities)
 
         } catch let error as APIError {
             throw error
@@ -12,8 +12,7 @@ struct ResultView: View {
     @State private var isLoadingDetails = false
 
     var annotatedImage: UIImage? {
-        guard let data = Data(base64Encoded: response.annotatedImage) else { return nil }
-        return UIImage(data: data)
+        UIImage(data: response.annotatedImage)
     }
 
     var body: some View {